@@ -1,11 +1,23 @@
+from time import monotonic
+started = monotonic()  # taken before the imports below, for the startup report
+
 import os
 import asyncio
 from .core import Agent, GoogleCalendarSource, GoogleTasksSource, GmailSource
 from dotenv import load_dotenv
 
+imported = monotonic()
+
 async def run_agent(enabled_sources):
     # await Agent([GoogleCalendarSource, GoogleTasksSource, GmailSource]).run()
-    await Agent(enabled_sources).run()
+    agent_started = monotonic()
+    agent = Agent(enabled_sources)
+    if os.getenv("DEBUG") == "enabled":
+        now = monotonic()
+        print(f"---\nDEBUG - startup: imports {imported - started:.2f}s, "
+              f"agent {now - agent_started:.2f}s, time to prompt {now - started:.2f}s "
+              f"(sources still initializing in the background)\n---")
+    await agent.run()
 
 def main():
     load_dotenv()
@@ -0,0 +1,70 @@
+"""
+Deterministic change detection over data-source records, used to decide
+whether anything happened that is worth telling the user about.
+"""
+
+from typing import Dict, Iterable, List
+
+from .context_delta import Snapshot, SourceDiff, diff_snapshots, take_snapshot
+from .data_sources import DataSource
+
+class ChangeDetector:
+    """
+    Compares each source's records with what it saw on the previous check,
+    by record ID and content hash. A change is notable when a record is new,
+    or when one of the source's notable_fields changed (a moved event, a new
+    due date); removals and other edits are not.
+    """
+
+    def __init__(self, sources: Iterable[DataSource]):
+        self.sources = list(sources)
+        self.baselines: Dict[DataSource, Snapshot] = {}
+        self.last_changes: Dict[DataSource, SourceDiff] = {}
+
+    def _notable(self, source: DataSource, diff: SourceDiff) -> SourceDiff:
+        notable = SourceDiff()
+        notable.added = diff.added
+        notable.modified = [
+            (old, new) for old, new in diff.modified
+            if any(getattr(old, field, None) != getattr(new, field, None) for field in source.notable_fields)
+        ]
+        return notable
+
+    def check(self) -> Dict[DataSource, SourceDiff]:
+        """
+        Notable changes per source since the previous check. The first check
+        of a source only records its baseline; a source that cannot be
+        fetched is skipped and keeps the baseline it had.
+        """
+        changes = {}
+        for source in self.sources:
+            try:
+                records = source.get_records()
+            except Exception as e:
+                print(f"Error checking {source.name} for changes: {e}")
+                continue
+            if not isinstance(records, list):
+                continue
+
+            current = take_snapshot(source, records)
+            previous = self.baselines.get(source)
+            self.baselines[source] = current
+            if previous is None:
+                continue
+
+            notable = self._notable(source, diff_snapshots(previous, current))
+            if notable:
+                changes[source] = notable
+
+        self.last_changes = changes
+        return changes
+
+    def describe(self) -> str:
+        """Plain-text summary of the changes found by the last check."""
+        lines: List[str] = []
+        for source, diff in self.last_changes.items():
+            if diff.added:
+                lines.append(f"New in {source.name}:\n" + source.format_records(diff.added))
+            if diff.modified:
+                lines.append(f"Changed in {source.name}:\n" + source.format_records([new for _, new in diff.modified]))
+        return "\n".join(lines)
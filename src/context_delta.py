@@ -0,0 +1,98 @@
+"""
+Delta context: remembers which records from each data source the model has
+already been shown, and describes only what was added, removed or modified since.
+"""
+
+import dataclasses
+import hashlib
+import json
+from typing import Any, Dict, List, Tuple
+
+from .data_sources import DataSource
+
+# record id -> (fingerprint, record)
+Snapshot = Dict[str, Tuple[str, Any]]
+
+def _encode(value: Any) -> Any:
+    if dataclasses.is_dataclass(value):
+        return {field.name: getattr(value, field.name) for field in dataclasses.fields(value)}
+    return str(value)
+
+def record_fingerprint(record: Any) -> str:
+    """Content hash of a record; records with equal content hash equally."""
+    encoded = json.dumps(record, sort_keys=True, default=_encode)
+    return hashlib.sha1(encoded.encode()).hexdigest()
+
+class SourceDiff:
+    """Records added, removed and modified between two snapshots of one source."""
+
+    def __init__(self):
+        self.added: List[Any] = []
+        self.removed: List[Any] = []
+        self.modified: List[Tuple[Any, Any]] = []  # (old, new)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.modified)
+
+def take_snapshot(source: DataSource, records: List[Any]) -> Snapshot:
+    return {
+        source.record_id(record): (record_fingerprint(record), record)
+        for record in records
+    }
+
+def diff_snapshots(previous: Snapshot, current: Snapshot) -> SourceDiff:
+    diff = SourceDiff()
+    for record_id, (fingerprint, record) in current.items():
+        if record_id not in previous:
+            diff.added.append(record)
+        elif previous[record_id][0] != fingerprint:
+            diff.modified.append((previous[record_id][1], record))
+    for record_id, (_, record) in previous.items():
+        if record_id not in current:
+            diff.removed.append(record)
+    return diff
+
+class ContextTracker:
+    """
+    Tracks the last snapshot of each source that was committed to the conversation.
+    Rendering never changes that state; call commit() once the context is stored.
+    """
+
+    def __init__(self):
+        self.seen: Dict[DataSource, Snapshot] = {}
+
+    def render(self, source: DataSource, records: List[Any], full: bool) -> Tuple[str, Snapshot]:
+        """
+        Describe the source's records, either in full or as changes since the
+        committed snapshot. Returns the text (empty when nothing changed) and
+        the new snapshot to commit.
+        """
+        current = take_snapshot(source, records)
+        if full:
+            return source.format_records(records), current
+        if source not in self.seen:
+            # Nothing to compare with: all of it, marked as such among the updates
+            return f"{source.name} (current data, not changes):\n" + source.format_records(records), current
+
+        diff = diff_snapshots(self.seen[source], current)
+        if not diff:
+            return "", current
+
+        counts = f"{len(diff.added)} new, {len(diff.modified)} changed, {len(diff.removed)} removed"
+        parts = [f"{source.name} changes since the last update ({counts}):\n"]
+        if diff.added:
+            parts.append("New:\n" + source.format_records(diff.added))
+        if diff.modified:
+            parts.append("Changed (current version):\n" + source.format_records([new for _, new in diff.modified]))
+        if diff.removed:
+            parts.append("Removed:\n" + source.format_records(diff.removed))
+        return "".join(part if part.endswith("\n") else part + "\n" for part in parts), current
+
+    def commit(self, snapshots: Dict[DataSource, Snapshot], replace: bool = False):
+        """Record snapshots as seen; replace forgets sources missing from a full snapshot."""
+        if replace:
+            self.seen.clear()
+        self.seen.update(snapshots)
+
+    def reset(self):
+        self.seen.clear()
@@ -1,8 +1,21 @@
 import asyncio
-from datetime import datetime, time
+from time import monotonic
+from concurrent.futures import ThreadPoolExecutor, Future
+from functools import partial
+from datetime import datetime
+from itertools import zip_longest
+from typing import Callable, Optional
 from .llm_interface import LLMInterface
 from .data_sources import *
+from .context_delta import ContextTracker, Snapshot, record_fingerprint
+from .retrieval import RetrievalIndex, expand_query
+from .router import QueryRouter
+from .change_detector import ChangeDetector
+from .scheduler import Job, Scheduler
+from .prefetcher import Prefetcher
 import subprocess
+import threading
+import json
 import os
 
 def say(string:str):
@@ -22,127 +35,534 @@ def get_formatted_datetime() -> str:
     """Returns current date and time in a consistent, readable format."""
     return datetime.now().strftime("%A, %B %d, %Y at %I:%M %p")
 
+# How the data sources reach the model in each CONTEXT_MODE, for the system prompt
+CONTEXT_MODE_PROMPTS = {
+    "delta": "The data sources are attached in full (\"Current data sources\") to one user message; "
+             "the user messages after it carry only \"Data source updates\" since then. Combine them for the current state.",
+    "full": "The current data sources are attached to the user's latest message only.",
+    "retrieval": "The data source items most relevant to the user's latest message are attached to it; "
+                 "other items may exist that are not shown.",
+    "tools": "Look up calendar, email and task data with the available tools when you need it."
+}
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) for when no tokenizer is given."""
+    return len(text) // 4 + 1
+
 class Conversation:
-    def __init__(self, sys_msg: str, max_history=10):
+    def __init__(self, sys_msg: str, max_history_tokens: int = 4000,
+                 tokenizer: Callable[[str], int] = estimate_tokens):
+        """
+        History is trimmed oldest-first to stay within max_history_tokens,
+        as measured by tokenizer (any callable mapping text to a token count).
+        """
         self.sys_msg = {"role": "system", "content": sys_msg}
         self.messages = []
-        self.max_history = max_history
+        self.max_history_tokens = max_history_tokens
+        self.tokenizer = tokenizer
+        # lock guards the message list, which worker threads also read;
+        # turn_lock is held for a whole question-and-answer turn so that
+        # concurrent turns (user input, proactive triggers) take turns
+        self.lock = threading.RLock()
+        self.turn_lock = asyncio.Lock()
     
-    def add_interaction(self, role: str, content: str):
+    def count_tokens(self, message: dict) -> int:
+        # A few tokens of per-message overhead for the role and separators.
+        # Attached context is sent with the message, so it counts too.
+        return self.tokenizer(message.get("context", "") + message["content"]) + 4
+
+    def add_interaction(self, role: str, content: str, context: str = "") -> dict:
         """
         role should either be 'assistant' or 'user'
+        context, if given, is stored alongside the message and sent with it
+        for as long as the message stays in the history.
         """
-        self.messages.append(
-            {"role": role, "content": content}
-        )
+        message = {"role": role, "content": content}
+        if context:
+            message["context"] = context
+        with self.lock:
+            self.messages.append(message)
 
-        # Keep only recent history to manage context length
-        if len(self.messages) > self.max_history:
-            self.messages.pop(0)
+            # Keep only recent history to manage context length
+            self.messages = self._fit(self.messages, self.max_history_tokens)
         
         # print("\n".join(str(msg) for msg in self.messages))
+        return message
+
+    def _fit(self, messages: list[dict], budget: int) -> list[dict]:
+        """
+        The most recent messages that fit in budget, starting with a user message.
+        Once attached context no longer fits, it is dropped from that message
+        and every older one, which keep their text as copies; a snapshot
+        message that loses its context is then no longer in the history.
+        """
+        kept = []
+        stripped = False
+        for message in reversed(messages):
+            if "context" in message and (stripped or self.count_tokens(message) > budget):
+                message = {"role": message["role"], "content": message["content"]}
+                stripped = True
+            budget -= self.count_tokens(message)
+            if budget < 0:
+                break
+            kept.append(message)
+        kept.reverse()
+
+        while kept and kept[0]["role"] != "user":
+            kept.pop(0)
+        return kept
     
-    def get_messages(self) -> list[dict]:
-        return [self.sys_msg] + self.messages
+    def history_for(self, user_input: str) -> list[dict]:
+        """The stored messages that will be sent along with user_input."""
+        budget = self.max_history_tokens - self.count_tokens({"role": "user", "content": user_input})
+        with self.lock:
+            return self._fit(self.messages, budget)
+
+    @staticmethod
+    def _render(message: dict) -> dict:
+        return {"role": message["role"], "content": message.get("context", "") + message["content"]}
+
+    def get_messages(self, user_input: Optional[str] = None, context: str = "") -> list[dict]:
+        """
+        Messages to send to the LLM: the system prompt, the history and, if
+        given, the new user input with the current context prepended.
+        """
+        if user_input is None:
+            with self.lock:
+                return [self.sys_msg] + [self._render(message) for message in self.messages]
+
+        new_message = {"role": "user", "content": context + user_input}
+        history = [self._render(message) for message in self.history_for(user_input)]
+        return [self.sys_msg] + history + [new_message]
 
 class ProactiveTriggerHandler:
     def __init__(self, agent: "Agent"):
         self.agent = agent
+        self.change_detector = ChangeDetector(agent.data_sources)
+        # Each trigger fires on a cron or interval schedule (CronTrigger or
+        # IntervalTrigger, imported from .scheduler when enabling one); 'condition' (optional)
+        # is checked at fire time and 'prompt' may be a string or a callable.
+        # Briefings are answers for the user, so they go to the large model;
+        # 'tier' picks another ('small', or 'cascade' for small first)
         self.triggers = [
             # {
             #     'name': 'morning_briefing',
-            #     'condition': lambda: self._is_time(time(8, 30)),  # 8:30 AM
+            #     'trigger': CronTrigger("30 8 * * *"),  # 8:30 AM
             #     'prompt': "Generate a concise morning briefing. Consider: current time, today's calendar events, urgent emails, and outstanding tasks. Make it friendly and motivational"
             # }
             # ,{
             #     'name': 'update',
+            #     'trigger': IntervalTrigger(60),
             #     'condition': lambda: self._user_update(),
-            #     'prompt': "Write a brief but helpful message updating me only on what with my calendar, email, or tasks has changed."
+            #     'prompt': lambda: "Write a brief but helpful message updating me only on what with my calendar, email, or tasks has changed.\n\n" + self.change_detector.describe()
             # }
             # Add more triggers here
         ]
+        self.scheduler = Scheduler()
 
-    def _is_time(self, target_time: time, tolerance_minutes: int = 0) -> bool:
-        now = datetime.now().time()
-        target_minutes = target_time.hour * 60 + target_time.minute
-        current_minutes = now.hour * 60 + now.minute
-        diff = abs(current_minutes - target_minutes)
-        # print(f"Time check: Current {now}, Target {target_time}, Diff {diff} minutes")  # Debug
-        return diff <= tolerance_minutes
-    
     def _user_update(self):
+        """
+        True when there is something new to tell the user: new unread mail,
+        a new or moved event, a new task or a changed due date.
+        Decided locally, without asking the LLM.
+        """
+        # Always check, so the baseline stays current
+        changes = self.change_detector.check()
+        if changes and os.getenv("DEBUG") == "enabled":
+            print(f"---\nDEBUG - notable changes:\n{self.change_detector.describe()}\n---\n")
         if len(self.agent.conversation.get_messages()) == 1:
             return True
-        
-        response = self.agent.process_query(
-            """Based on what you know about what the I am doing right now, is there anything helpful you should say to me?
-For example:
-If there is a new item from the data sources that neither of us have mentioned, the answer is yes.
-If nothing has changed, the answer is no.
-If you are not sure, the answer is no.
-
-Respond only with 'yes' or 'no' and nothing else""",
-            conversation_effect=False
-        )
-        response = response.strip().lower()
-        if response.startswith("yes"):
-            return True
-        return False
+        return bool(changes)
 
+    async def _fire(self, trigger: dict):
+        # Conditions may fetch from the sources, so they are checked off the loop
+        condition = trigger.get('condition')
+        if condition is not None and not await asyncio.to_thread(condition):
+            return
+        prompt = trigger['prompt']
+        await self.agent.process_query(prompt() if callable(prompt) else prompt, tier=trigger.get('tier', 'large'))
+        print("\nYou: ", end="", flush=True)
 
     async def check_triggers(self):
-        while True:
-            # print(f"Checking triggers at {datetime.now().strftime('%H:%M')}")  # Debug
-            for trigger in self.triggers:
-                if trigger['condition']():
-                    # print(f"Trigger '{trigger['name']}' activated!")  # Debug
-                    self.agent.process_query(trigger['prompt'])
-                    print("\nYou: ", end="")
-                else:
-                    # print(f"Trigger '{trigger['name']}' condition not met")  # Debug
-                    pass
-            await asyncio.sleep(60)
+        for trigger in self.triggers:
+            self.scheduler.add_job(Job(
+                trigger['name'],
+                trigger['trigger'],
+                partial(self._fire, trigger),
+                misfire_grace_time=trigger.get('misfire_grace_time', 60.0),
+                coalesce=trigger.get('coalesce', True)
+            ))
+        await self.scheduler.run()
 
 
 class Agent:
     def __init__(self, data_sources: list[DataSource], memory = None):
         self.data_sources = [source() for source in data_sources]
+        # One worker per source so a slow API never queues behind another
+        self.fetch_executor = ThreadPoolExecutor(
+            max_workers=max(len(self.data_sources), 1),
+            thread_name_prefix="jarvis-fetch"
+        )
+        self.tool_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="jarvis-tool")
+        self.max_tool_rounds = 5
+        self.pending_fetches: dict[DataSource, Future] = {}
+        self.last_outputs: dict[DataSource, str] = {}
+
+        # 'delta' sends a full snapshot of the sources once and then only what
+        # changed, for as long as that snapshot is still in the history;
+        # 'full' sends everything with every request;
+        # 'retrieval' sends only the records most relevant to each message;
+        # 'tools' sends nothing and lets the model call source tools on demand
+        self.context_mode = os.getenv("CONTEXT_MODE", "delta")
+        self.context_tracker = ContextTracker()
+        self.snapshot_message: Optional[dict] = None
+
+        self.retrieval_index = None
+        if self.context_mode == "retrieval":
+            self.retrieval_index = RetrievalIndex(os.getenv(
+                "RETRIEVAL_INDEX_PATH",
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_index.json")
+            ))
+            self.retrieval_top_k = int(os.getenv("RETRIEVAL_TOP_K", "10"))
+            self.retrieval_token_budget = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "1500"))
+
         self.llm_interface = LLMInterface()
+        # Only the sources a message is about are fetched for it; messages the
+        # patterns cannot place can be classified by the small model
+        self.router = None
+        if os.getenv("ROUTER", "enabled") == "enabled":
+            classifier = self._classify_sources if os.getenv("ROUTER_CLASSIFIER", "disabled") == "enabled" else None
+            self.router = QueryRouter(self.data_sources, classifier=classifier)
         self.conversation = Conversation(
-            """You are Jarvis, a helpful AI assistant with read-only access to the user's calendar, tasks, and email.
-You should use the provided data sources to give accurate and helpful responses. You can only directly remember up to 10 messages.
+            f"""You are Jarvis, a helpful AI assistant with read-only access to the user's calendar, tasks, and email.
+You should use the provided data sources to give accurate and helpful responses. You can only directly remember the most recent part of the conversation.
+{CONTEXT_MODE_PROMPTS.get(self.context_mode, CONTEXT_MODE_PROMPTS['full'])}
 When referencing information from data sources, be specific about where the information came from.
-If you don't have enough information to answer completely, say so."""
+If you don't have enough information to answer completely, say so.""",
+            max_history_tokens=int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
         )
         self.proactive = ProactiveTriggerHandler(self)
+
+        # Keeps source data warm while the user is typing
+        self.prefetcher = None
+        if os.getenv("PREFETCH", "enabled") == "enabled":
+            self.prefetcher = Prefetcher(
+                self.data_sources,
+                self.fetch_executor,
+                min_interval=float(os.getenv("PREFETCH_MIN_INTERVAL", "15")),
+                max_interval=float(os.getenv("PREFETCH_MAX_INTERVAL", "300")),
+                on_refresh=self.last_outputs.__setitem__
+            )
+
+        # Sources authenticate, build their clients and fetch in parallel in
+        # the background, so the prompt does not wait for any of them
+        for source in self.data_sources:
+            self._submit_fetch(source)
     
 
-    def get_context(self):
+    def _submit_fetch(self, source: DataSource) -> Future:
+        """
+        Start fetching a source in the background.
+        A fetch that outlived its deadline on an earlier turn is reused rather
+        than started again, so a source never has two fetches in flight.
+        """
+        future = self.pending_fetches.get(source)
+        if future is None or future.done():
+            future = self.fetch_executor.submit(source.get_snapshot)
+            future.add_done_callback(lambda f: self._record_output(source, f))
+            self.pending_fetches[source] = future
+        return future
+
+    def _record_output(self, source: DataSource, future: Future):
+        """Remember the latest successful output so late results still serve as stale data."""
+        if not future.cancelled() and future.exception() is None:
+            self.last_outputs[source] = future.result()[1]
+
+    async def get_context(self):
+        return (await self.build_context())[0]
+
+    @staticmethod
+    def _consume(waiter: asyncio.Future):
+        """Mark a fetch's outcome as seen, so one nobody waited for is not reported as unhandled."""
+        if not waiter.cancelled():
+            waiter.exception()
+
+    async def build_context(self, full: bool = True, sources: Optional[list[DataSource]] = None,
+                      query: Optional[str] = None) -> tuple[str, dict[DataSource, Snapshot]]:
+        """
+        Fetch the given sources (default: all) concurrently and describe them.
+        Unless full is set, sources already committed to the context tracker
+        are described only by what changed since.
+        With a retrieval index and a query, only the records relevant to the query are included.
+        Returns the context and the snapshots to commit once it has been stored.
+        """
         context = "Current date/time: " + get_formatted_datetime() + "\n"
-        for source in self.data_sources:
-            context += source.get_data()
-        return context #+ "\nYour memory:\n"+self.memory+"\n(end of memories)\n"
+        snapshots: dict[DataSource, Snapshot] = {}
+        unchanged = []
+        retrievable: dict[DataSource, list] = {}
+
+        started = monotonic()
+        if sources is None:
+            sources = self.data_sources
+        waiters = []
+        for source in sources:
+            waiter = asyncio.wrap_future(self._submit_fetch(source))
+            waiter.add_done_callback(self._consume)
+            waiters.append((source, waiter))
+
+        for source, waiter in waiters:
+            remaining = source.fetch_timeout - (monotonic() - started)
+            # Unlike wait_for, wait leaves an unfinished fetch running for the next turn
+            await asyncio.wait([waiter], timeout=max(remaining, 0))
+            try:
+                if not waiter.done():
+                    raise TimeoutError(f"no response within {source.fetch_timeout:g}s")
+                records, output = waiter.result()
+            except Exception as e:
+                records, output = None, self._unavailable(source, str(e), full)
+
+            if isinstance(records, list) and self.retrieval_index is not None and query is not None:
+                retrievable[source] = records
+                continue
+            if isinstance(records, list):
+                output, snapshots[source] = self.context_tracker.render(source, records, full)
+            if not output:
+                unchanged.append(source.name)
+                continue
+
+            context += output if output.endswith("\n") else output + "\n"
+
+        if unchanged:
+            context += f"No changes since the last update: {', '.join(unchanged)}.\n"
+        if retrievable:
+            context += await asyncio.to_thread(self._retrieve, query, retrievable)
+
+        return context, snapshots #+ "\nYour memory:\n"+self.memory+"\n(end of memories)\n"
+
+    def _retrieve(self, query: str, records_by_source: dict[DataSource, list]) -> str:
+        """Describe the records most relevant to query, within the retrieval token budget."""
+        by_key = {}
+        for source, records in records_by_source.items():
+            entries = {}
+            for position, record in enumerate(records):
+                record_id = source.record_id(record)
+                by_key[(source.name, record_id)] = (source, position, record)
+                entries[record_id] = (record_fingerprint(record), source.record_text(record))
+            self.retrieval_index.sync_source(source.name, entries)
+        self.retrieval_index.save()
+
+        hits = self.retrieval_index.search(
+            expand_query(query),
+            self.retrieval_top_k,
+            {source.name for source in records_by_source}
+        )
+        keys = [(name, record_id) for name, record_id, _ in hits if (name, record_id) in by_key]
+        if not keys:
+            # Nothing matched; take the leading records of each source in turn
+            # (newest mail, soonest events and tasks)
+            queues = [[(source.name, source.record_id(record)) for record in records]
+                      for source, records in records_by_source.items()]
+            keys = [key for group in zip_longest(*queues) for key in group if key is not None][:self.retrieval_top_k]
+
+        selected: dict[DataSource, list] = {source: [] for source in records_by_source}
+        budget = self.retrieval_token_budget
+        for key in keys:
+            source, position, record = by_key[key]
+            budget -= self.conversation.tokenizer(source.format_records([record]))
+            if budget < 0:
+                break
+            selected[source].append((position, record))
 
-    def process_query(self, user_input: str, conversation_effect: bool = True, use_context: bool = True):
-        
         context = ""
+        for source, chosen in selected.items():
+            total = len(records_by_source[source])
+            if not chosen:
+                context += f"{source.name}: none of {total} items look relevant to this message.\n"
+                continue
+            chosen.sort(key=lambda item: item[0])  # keep the source's own ordering
+            output = source.format_records([record for _, record in chosen])
+            context += f"{source.name} ({len(chosen)} of {total} items):\n"
+            context += output if output.endswith("\n") else output + "\n"
+        return context
+
+    def _run_tool(self, tools: dict[str, dict], call: dict) -> str:
+        """Run one tool call from the model; failures are reported back to it as text."""
+        name = call.get('function', {}).get('name')
+        tool = tools.get(name)
+        if tool is None:
+            return f"Unknown tool: {name}"
+        try:
+            arguments = json.loads(call['function'].get('arguments') or "{}")
+            return tool['function'](**arguments)
+        except Exception as e:
+            return f"Error running {name}: {e}"
+
+    async def _answer_with_tools(self, messages: list[dict], tools: list[dict]) -> str:
+        """
+        Let the model call source tools until it can answer.
+        Tool calls from one reply are independent, so they run concurrently.
+        """
+        specs = [
+            {"type": "function", "function": {key: tool[key] for key in ('name', 'description', 'parameters')}}
+            for tool in tools
+        ]
+        tools_by_name = {tool['name']: tool for tool in tools}
+        messages = list(messages)
+
+        try:
+            for round_number in range(self.max_tool_rounds + 1):
+                # The last round forbids further calls so the model has to answer
+                last_round = round_number == self.max_tool_rounds
+                reply = await self.llm_interface.get_tool_response_async(messages, specs, "none" if last_round else "auto")
+                calls = reply.get('tool_calls') or []
+                if not calls or last_round:
+                    return (reply.get('content') or "").strip()
+
+                if os.getenv("DEBUG") == "enabled":
+                    print(f"---\nDEBUG - tool calls: {[call['function']['name'] for call in calls]}\n---\n")
+
+                messages.append({"role": "assistant", "content": reply.get('content') or "", "tool_calls": calls})
+                loop = asyncio.get_running_loop()
+                results = await asyncio.gather(*(
+                    loop.run_in_executor(self.tool_executor, self._run_tool, tools_by_name, call)
+                    for call in calls
+                ))
+                for call, result in zip(calls, results):
+                    messages.append({"role": "tool", "tool_call_id": call['id'], "content": result})
+        except Exception as e:
+            print(f"API error: {e}")
+            return f"Sorry, I encountered an error: {str(e)}"
+
+    async def _respond(self, messages: list[dict], tools: Optional[list[dict]] = None,
+                       on_token: Optional[Callable[[str], None]] = None, tier: str = "large",
+                       use_cache: bool = False) -> str:
+        if tools:
+            return await self._answer_with_tools(messages, tools)
+        return await self.llm_interface.get_response_async(messages, on_token=on_token, use_cache=use_cache, tier=tier)
+
+    def _unavailable(self, source: DataSource, reason: str, include_last: bool = True) -> str:
+        """Report a source that could not be fetched, falling back to its last good data."""
+        if os.getenv("DEBUG") == "enabled":
+            print(f"---\nDEBUG - {source.name} unavailable: {reason}\n---\n")
+
+        last_output = self.last_outputs.get(source)
+        if last_output is None or not include_last:
+            return f"{source.name}: unavailable ({reason}).\n"
+        return f"{source.name} (stale - showing last known data, {reason}):\n{last_output}"
+
+    def _snapshot_in_history(self, user_input: str) -> bool:
+        """Whether the last full snapshot will still be sent along with user_input."""
+        return any(message is self.snapshot_message for message in self.conversation.history_for(user_input))
+
+    def _classify_sources(self, query: str) -> Optional[list[str]]:
+        """Ask the model which sources a message needs; None if it gives no usable answer."""
+        names = [source.name for source in self.data_sources]
+
+        def parse(response: str) -> Optional[list[str]]:
+            parts = [part.strip().strip(".").lower() for part in response.split(",")]
+            if parts == ["none"]:
+                return []
+            chosen = [name for name in names if name.lower() in parts]
+            return chosen if len(chosen) == len(parts) else None
+
+        messages = [
+            {"role": "system", "content": f"""Decide which of the user's data sources are needed to answer their message.
+The sources are: {', '.join(names)}.
+Reply only with the needed source names separated by commas, or 'none'."""},
+            {"role": "user", "content": query}
+        ]
+        # Deterministic, so a repeat of the same message can be answered from the cache
+        response = self.llm_interface.get_cascade_response(
+            messages,
+            use_cache=True,
+            accept=lambda response: parse(response) is not None,
+            params={"temperature": 0}
+        )
+        return parse(response)
+
+    async def process_query(self, user_input: str, conversation_effect: bool = True, use_context: bool = True,
+                            sources: Optional[list[DataSource]] = None, tier: str = "large"):
+        """
+        Answer user_input. Context comes from the given sources, or from those
+        the router picks for the message when none are given.
+        tier picks the model: 'large', 'small', or 'cascade' (small first,
+        escalating to large when its answer is not usable).
+        Turns run one at a time; a turn cancelled part way leaves the conversation untouched.
+        """
+        async with self.conversation.turn_lock:
+            return await self._process_query(user_input, conversation_effect, use_context, sources, tier)
+
+    async def _process_query(self, user_input: str, conversation_effect: bool, use_context: bool,
+                             sources: Optional[list[DataSource]], tier: str):
+        context = ""
+        snapshots = {}
+        tools = None
+        delta = use_context and self.context_mode == "delta"
+        full = not (delta and self._snapshot_in_history(user_input))
 
         if use_context:
-            context += f"Current data sources:\n{self.get_context()}"
+            if sources is None and self.router is not None:
+                # Off the loop, as the router may ask the model
+                sources = await asyncio.to_thread(self.router.route, user_input)
+            if self.context_mode == "tools":
+                # Nothing is fetched up front; the model asks for what it needs
+                tools = [tool for source in (self.data_sources if sources is None else sources)
+                         for tool in source.get_tools()]
+                context += "Current date/time: " + get_formatted_datetime() + "\n"
+                if tools:
+                    context += "Use the available tools to look up calendar, email and task data when needed.\n"
+            else:
+                source_context, snapshots = await self.build_context(full, sources, query=user_input)
+                context += f"Current data sources:\n{source_context}" if full else f"Data source updates:\n{source_context}"
 
-        self.conversation.add_interaction("user", context + user_input)
+        messages = self.conversation.get_messages(user_input, context)
 
-        messages = self.conversation.get_messages()
-        response = self.llm_interface.get_response(messages)
+        if not conversation_effect:
+            return await self._respond(messages, tools, tier=tier, use_cache=True)
 
-        if conversation_effect:
-            self.conversation.add_interaction("assistant", response)
-            # {datetime.now().strftime("%A, %B %d, %Y at %I:%M %p")}
-            columns, lines = os.get_terminal_size()
-            print("-" * columns)
-            print(f"\n{datetime.now().strftime("%H:%M:%S")} Jarvis: {response}")
+        # {datetime.now().strftime("%A, %B %d, %Y at %I:%M %p")}
+        columns, lines = os.get_terminal_size()
+        print("-" * columns)
+        print(f"\n{datetime.now().strftime('%H:%M:%S')} Jarvis: ", end="", flush=True)
+
+        streamed = []
+
+        def print_token(token: str):
+            if not streamed:
+                token = token.lstrip()  # match the stripped non-streaming output
+                if not token:
+                    return
+            streamed.append(token)
+            print(token, end="", flush=True)
 
+        response = await self._respond(messages, tools, on_token=print_token, tier=tier)
+        # Errors and non-streamed responses arrive all at once
+        if not streamed:
+            print(response)
+        elif response != "".join(streamed).rstrip():
+            print(f"\n{response}")  # the stream broke off part way
+        else:
+            print()
+
+        self._store_turn(user_input, response, context if delta else "", snapshots, full)
         return response
+
+    def _store_turn(self, user_input: str, response: str, context: str,
+                    snapshots: dict[DataSource, Snapshot], full: bool):
+        """
+        Add a finished turn to the conversation. Delta context stays with the
+        user message so later turns can build on it; the message becomes the
+        snapshot only if it renders every source in full.
+        """
+        # Both messages go in together so a reader never sees half a turn
+        with self.conversation.lock:
+            message = self.conversation.add_interaction("user", user_input, context=context)
+            if context:
+                if full:
+                    complete = all(source in snapshots for source in self.data_sources)
+                    self.snapshot_message = message if complete else None
+                self.context_tracker.commit(snapshots, replace=full)
+            self.conversation.add_interaction("assistant", response)
     
 
     async def run(self):
@@ -151,28 +571,39 @@ If you don't have enough information to answer completely, say so."""
         
         async def input_loop():
             while True:
+                if self.prefetcher is not None:
+                    self.prefetcher.poke()
                 user_input = await asyncio.get_event_loop().run_in_executor(
                     None, input, "\nYou: "
                 )
                 if user_input.lower() == 'quit':
                     return
                 
-                self.process_query(user_input)
+                await self.process_query(user_input)
 
         # Run both tasks concurrently
         try:
             input_task = asyncio.create_task(input_loop())
             trigger_task = asyncio.create_task(self.proactive.check_triggers())
+            tasks = [input_task, trigger_task]
+            if self.prefetcher is not None:
+                tasks.append(asyncio.create_task(self.prefetcher.run()))
             
             # Wait for either task to complete
             done, pending = await asyncio.wait(
-                [input_task, trigger_task],
+                tasks,
                 return_when=asyncio.FIRST_COMPLETED
             )
             
-            # Cancel remaining tasks
+            # Cancel remaining tasks, including any turn in progress
             for task in pending:
                 task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
                 
         except asyncio.CancelledError:
-            pass
\ No newline at end of file
+            pass
+        finally:
+            self.fetch_executor.shutdown(wait=False, cancel_futures=True)
+            self.tool_executor.shutdown(wait=False, cancel_futures=True)
+            self.proactive.scheduler.shutdown()
+            self.llm_interface.close()
\ No newline at end of file
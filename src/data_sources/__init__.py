@@ -6,6 +6,10 @@ Requires proper Google OAuth2 credentials to function.
 
 # Import the classes we want to make available when importing the package
 from .data_source import DataSource
+from .google_source import GoogleSource
+from .record_store import RecordStore
+from .records import Email, Event, Task
+from .credentials import CredentialManager
 from .calendar_source import GoogleCalendarSource
 from .tasks_source import GoogleTasksSource
 from .email_source import GmailSource
@@ -1,165 +1,268 @@
-from .data_source import DataSource
-from datetime import datetime, timedelta
-from typing import List, Dict
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from .google_source import GoogleSource
+from .record_store import RecordStore
+from .records import Event
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Optional
+from googleapiclient.errors import HttpError
 import os
-import pickle
 
-class GoogleCalendarSource(DataSource):
+class GoogleCalendarSource(GoogleSource):
+    name = "Calendar"
+    api = "calendar"
+    api_version = "v3"
+    cache_ttl = 60.0
+    notable_fields = ('start', 'end')  # a moved event
+
     def __init__(self):
         super().__init__()
-        self.SCOPES = [
-            'https://www.googleapis.com/auth/calendar.readonly',
-            'https://www.googleapis.com/auth/gmail.readonly',
-            'https://www.googleapis.com/auth/tasks.readonly'
-        ]
-        self.service = self._initialize_service()
+        self.window_days = int(os.getenv('CALENDAR_WINDOW_DAYS', '14'))
+        self.max_workers = 4  # calendars synced in parallel
+        self.page_size = 250
+
+        # Local event store kept current with syncToken incremental sync:
+        # calendar id -> {'summary', 'sync_token', 'events': {event id: Event}}
+        self._calendars: Dict[str, Dict] = {}
+        self._calendar_list_token: Optional[str] = None
+        self._window_start: Optional[datetime] = None
         
-    def _initialize_service(self):
-        """Initialize and return the Calendar service."""
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        token_path = os.path.join(current_dir, 'token_calendar.pickle')
-        credentials_path = os.path.join(current_dir, 'credentials.json')
-
-        creds = None
-        if os.path.exists(token_path):
-            with open(token_path, 'rb') as token:
-                creds = pickle.load(token)
-
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                if not os.path.exists(credentials_path):
-                    raise FileNotFoundError(
-                        "credentials.json not found. Download it from Google Cloud Console."
-                    )
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    credentials_path, self.SCOPES
+    def _sync_calendar_list(self):
+        """Bring the set of known calendars up to date, incrementally when possible."""
+        page_token = None
+        try:
+            while True:
+                request = self.service.calendarList().list(
+                    pageToken=page_token,
+                    syncToken=self._calendar_list_token
                 )
-                creds = flow.run_local_server(port=0)
+                result = self._execute(request)
+
+                for entry in result.get('items', []):
+                    if entry.get('deleted'):
+                        self._calendars.pop(entry['id'], None)
+                    elif entry['id'] in self._calendars:
+                        state = self._calendars[entry['id']]
+                        if state['summary'] != entry.get('summary', ''):
+                            state['summary'] = entry.get('summary', '')
+                            state['events'] = {
+                                event_id: replace(event, calendar=state['summary'])
+                                for event_id, event in state['events'].items()
+                            }
+                    else:
+                        self._calendars[entry['id']] = {
+                            'summary': entry.get('summary', ''),
+                            'sync_token': None,
+                            'events': {}
+                        }
+
+                page_token = result.get('nextPageToken')
+                if not page_token:
+                    break
+        except HttpError as e:
+            if e.resp.status != 410 or self._calendar_list_token is None:
+                raise
+            # Sync token expired; list every calendar again
+            self._calendar_list_token = None
+            self._calendars.clear()
+            return self._sync_calendar_list()
+
+        self._calendar_list_token = result.get('nextSyncToken')
+
+    def _sync_calendar(self, calendar_id: str):
+        """Page through one calendar's changes since its last sync token."""
+        state = self._calendars[calendar_id]
+        params = {
+            'calendarId': calendar_id,
+            'singleEvents': True,
+            'maxResults': self.page_size
+        }
+        if state['sync_token']:
+            params['syncToken'] = state['sync_token']
+        else:
+            # Full sync of the current window; later deltas need no time bounds
+            state['events'] = {}
+            params['timeMin'] = self._window_start.isoformat().replace('+00:00', 'Z')
+            params['timeMax'] = (self._window_start + timedelta(days=self.window_days)).isoformat().replace('+00:00', 'Z')
+
+        page_token = None
+        try:
+            while True:
+                result = self._execute(self.service.events().list(pageToken=page_token, **params))
+
+                for event in result.get('items', []):
+                    if event.get('status') == 'cancelled':
+                        state['events'].pop(event['id'], None)
+                    else:
+                        state['events'][event['id']] = self._process_event(event, state['summary'])
 
-            with open(token_path, 'wb') as token:
-                pickle.dump(creds, token)
+                page_token = result.get('nextPageToken')
+                if not page_token:
+                    break
+        except HttpError as e:
+            if e.resp.status != 410 or not state['sync_token']:
+                raise
+            # Sync token expired; fall back to a full sync of this calendar
+            state['sync_token'] = None
+            return self._sync_calendar(calendar_id)
 
-        return build('calendar', 'v3', credentials=creds)
+        state['sync_token'] = result.get('nextSyncToken')
 
-    def _fetch_data(self) -> List[Dict]:
+    def _process_event(self, event: Dict, calendar_summary: str) -> Event:
+        """Convert a Calendar API event into a consistent format."""
+        start = event['start'].get('dateTime', event['start'].get('date'))
+        end = event['end'].get('dateTime', event['end'].get('date'))
+
+        # Convert string timestamps to datetime objects
+        if 'T' in start:  # This is a datetime
+            start_time = datetime.fromisoformat(start.replace('Z', '+00:00'))
+            end_time = datetime.fromisoformat(end.replace('Z', '+00:00'))
+        else:  # This is a date
+            start_time = datetime.fromisoformat(start)
+            end_time = datetime.fromisoformat(end)
+
+        return Event(
+            id=event['id'],
+            calendar=calendar_summary,
+            summary=event.get('summary', 'Untitled Event'),
+            start=start_time,
+            end=end_time,
+            location=event.get('location', ''),
+            description=event.get('description', ''),
+            attendees=tuple(
+                attendee.get('email', '')
+                for attendee in event.get('attendees', [])
+            ),
+            etag=event.get('etag')
+        )
+
+    @staticmethod
+    def _aware(value: datetime) -> datetime:
+        """All-day events carry naive dates; treat them as local time for comparisons."""
+        return value if value.tzinfo is not None else value.astimezone()
+
+    def _fetch_data(self) -> List[Event]:
         """Fetch upcoming calendar events."""
         try:
-            # Get the start of today and end of next week
-            now = datetime.utcnow()
+            # Get the start of today and end of the window
+            now = datetime.now(timezone.utc)
             start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            end = start + timedelta(days=14)
-
-            # Format timestamps for Google Calendar API
-            start_str = start.isoformat() + 'Z'
-            end_str = end.isoformat() + 'Z'
-
-            # Call the Calendar API
-            events_result = self.service.events().list(
-                calendarId='primary',
-                timeMin=start_str,
-                timeMax=end_str,
-                maxResults=10,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            
-            events = events_result.get('items', [])
-            
-            # Process events into a consistent format
-            processed_events = []
-            for event in events:
-                start = event['start'].get('dateTime', event['start'].get('date'))
-                end = event['end'].get('dateTime', event['end'].get('date'))
-                
-                # Convert string timestamps to datetime objects
-                if 'T' in start:  # This is a datetime
-                    start_time = datetime.fromisoformat(start.replace('Z', '+00:00'))
-                    end_time = datetime.fromisoformat(end.replace('Z', '+00:00'))
-                else:  # This is a date
-                    start_time = datetime.fromisoformat(start)
-                    end_time = datetime.fromisoformat(end)
-
-                processed_events.append({
-                    'summary': event.get('summary', 'Untitled Event'),
-                    'start': start_time,
-                    'end': end_time,
-                    'location': event.get('location', ''),
-                    'description': event.get('description', ''),
-                    'attendees': [
-                        attendee.get('email', '')
-                        for attendee in event.get('attendees', [])
-                    ]
-                })
-            
-            return processed_events
+            end = start + timedelta(days=self.window_days)
+
+            # The stored events only cover the window they were synced for
+            if self._window_start != start:
+                self._window_start = start
+                for state in self._calendars.values():
+                    state['sync_token'] = None
+
+            self._sync_calendar_list()
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                list(pool.map(self._sync_calendar, list(self._calendars)))
+
+            # An event shared by several calendars is listed once, under the first
+            processed_events: Dict[str, Event] = {}
+            for state in self._calendars.values():
+                for event in state['events'].values():
+                    in_window = self._aware(event.end) > start and self._aware(event.start) < end
+                    if in_window and event.id not in processed_events:
+                        processed_events[event.id] = event
+
+            return sorted(processed_events.values(), key=lambda event: self._aware(event.start))
 
         except Exception as e:
             print(f"Error fetching calendar events: {e}")
-            return []
+            raise
+
+    def _index_records(self, events: List[Event]) -> RecordStore:
+        return RecordStore(events, sorted_by={
+            'date': lambda event: event.start.date(),
+            'start': lambda event: self._aware(event.start)
+        })
 
-    def _format_data(self, events: List[Dict]) -> str:
+    def _format_data(self, events: List[Event]) -> str:
         """Format calendar events into a readable string."""
         if not events:
             return "No upcoming events found."
 
-        formatted = "Upcoming Events:\n"
+        parts = ["Upcoming Events:\n"]
         current_date = None
 
         for event in events:
-            event_date = event['start'].date()
-            
+            event_date = event.start.date()
+
             # Add date header if this is a new date
             if current_date != event_date:
                 current_date = event_date
-                formatted += f"\n{event_date.strftime('%A, %B %d')}:\n"
-
-            # Format time
-            if isinstance(event['start'], datetime):
-                start_time = event['start'].strftime("%I:%M %p")
-                end_time = event['end'].strftime("%I:%M %p")
-                time_str = f"{start_time} - {end_time}"
-            else:
-                time_str = "All Day"
-
-            # Add event details
-            formatted += f"  - {event['summary']} ({time_str})\n"
-            
-            if event['location']:
-                formatted += f"    Location: {event['location']}\n"
-                
-            if event['attendees']:
-                formatted += f"    Attendees: {', '.join(event['attendees'])}\n"
-                
-            if event['description']:
-                desc_preview = event['description'][:100] + "..." if len(event['description']) > 100 else event['description']
-                formatted += f"    Description: {desc_preview}\n"
-
-        return formatted
-
-    def get_events_for_date(self, target_date: datetime) -> List[Dict]:
-        """Get events for a specific date."""
-        events = self._fetch_data()
+                parts.append(f"\n{event_date.strftime('%A, %B %d')}:\n")
+
+            parts.append(self.render_record(event))
+
+        return "".join(parts)
+
+    def _render_record(self, event: Event) -> str:
+        # Format time
+        if isinstance(event.start, datetime):
+            start_time = event.start.strftime("%I:%M %p")
+            end_time = event.end.strftime("%I:%M %p")
+            time_str = f"{start_time} - {end_time}"
+        else:
+            time_str = "All Day"
+
+        # Add event details
+        lines = [f"  - {event.summary} ({time_str})\n"]
+
+        if event.location:
+            lines.append(f"    Location: {event.location}\n")
+
+        if event.attendees:
+            lines.append(f"    Attendees: {', '.join(event.attendees)}\n")
+
+        if event.description:
+            desc_preview = event.description[:100] + "..." if len(event.description) > 100 else event.description
+            lines.append(f"    Description: {desc_preview}\n")
+
+        return "".join(lines)
+
+    def record_text(self, event: Event) -> str:
+        when = event.start.strftime("%A %B %d %I:%M %p").replace(" 0", " ")
+        return " ".join([
+            "event", event.summary, event.calendar, when, event.location,
+            event.description, " ".join(event.attendees)
+        ])
+
+    def get_tools(self) -> List[Dict]:
+        def next_event() -> str:
+            event = self.get_next_event()
+            return self.format_records([event] if event else [])
+
         return [
-            event for event in events 
-            if event['start'].date() == target_date.date()
+            {
+                'name': 'get_events_for_date',
+                'description': "List the user's calendar events on one date.",
+                'parameters': {
+                    'type': 'object',
+                    'properties': {
+                        'date': {'type': 'string', 'description': 'The date, as YYYY-MM-DD'}
+                    },
+                    'required': ['date']
+                },
+                'function': lambda date: self.format_records(
+                    self.get_events_for_date(datetime.fromisoformat(date))
+                )
+            },
+            {
+                'name': 'get_next_event',
+                'description': "Get the user's next upcoming calendar event.",
+                'parameters': {'type': 'object', 'properties': {}},
+                'function': next_event
+            }
         ]
 
-    def get_next_event(self) -> Dict:
+    def get_events_for_date(self, target_date: datetime) -> List[Event]:
+        """Get events for a specific date."""
+        return self.get_store().range('date', target_date.date(), target_date.date())
+
+    def get_next_event(self) -> Optional[Event]:
         """Get the next upcoming event."""
-        events = self._fetch_data()
-        if not events:
-            return None
-        
-        now = datetime.now()
-        future_events = [
-            event for event in events 
-            if event['start'] > now
-        ]
-        
-        return future_events[0] if future_events else None
+        return self.get_store().first_after('start', datetime.now(timezone.utc))
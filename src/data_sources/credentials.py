@@ -0,0 +1,139 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Iterator, List, Optional
+import os
+import pickle
+import threading
+
+# Every source is read through the same token, so it carries all of their scopes
+SCOPES = [
+    'https://www.googleapis.com/auth/gmail.readonly',
+    'https://www.googleapis.com/auth/calendar.readonly',
+    'https://www.googleapis.com/auth/tasks.readonly'
+]
+
+DATA_SOURCES_DIR = os.path.dirname(os.path.abspath(__file__))
+# Tokens saved per source by earlier versions; any of them can seed the shared one
+LEGACY_TOKEN_FILES = ['token_gmail.pickle', 'token_calendar.pickle', 'token_tasks.pickle']
+
+class CredentialManager:
+    """
+    Google OAuth credentials shared by every source: loaded (or authorized)
+    once, refreshed in the background shortly before they expire, and
+    handed out with a pool of authorized HTTP connections.
+    """
+
+    _shared: Optional["CredentialManager"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, token_path: Optional[str] = None, credentials_path: Optional[str] = None,
+                 refresh_margin: float = 300.0, max_idle_connections: int = 8):
+        self.token_path = token_path or os.path.join(DATA_SOURCES_DIR, 'token.pickle')
+        self.credentials_path = credentials_path or os.path.join(DATA_SOURCES_DIR, 'credentials.json')
+        self.refresh_margin = refresh_margin  # seconds before expiry to refresh
+        self.max_idle_connections = max_idle_connections
+        self.creds = None
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+        self._idle: List[Any] = []  # AuthorizedHttp connections not in use
+
+    @classmethod
+    def shared(cls) -> "CredentialManager":
+        """The process-wide manager used by the Google sources."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def _load_token(self):
+        for path in [self.token_path] + [os.path.join(DATA_SOURCES_DIR, name) for name in LEGACY_TOKEN_FILES]:
+            if os.path.exists(path):
+                with open(path, 'rb') as token:
+                    return pickle.load(token)
+        return None
+
+    def _save_token(self):
+        with open(self.token_path, 'wb') as token:
+            pickle.dump(self.creds, token)
+
+    def get_credentials(self):
+        """Valid credentials, running the OAuth flow the first time there are none."""
+        from google.auth.transport.requests import Request
+
+        with self._lock:
+            if self.creds is None:
+                self.creds = self._load_token()
+
+            if not self.creds or not self.creds.valid:
+                if self.creds and self.creds.expired and self.creds.refresh_token:
+                    self.creds.refresh(Request())
+                else:
+                    from google_auth_oauthlib.flow import InstalledAppFlow
+
+                    if not os.path.exists(self.credentials_path):
+                        raise FileNotFoundError(
+                            "credentials.json not found. Download it from Google Cloud Console."
+                        )
+                    flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, SCOPES)
+                    self.creds = flow.run_local_server(port=0)
+
+                # Save the credentials for the next run
+                self._save_token()
+
+            if self._timer is None:
+                self._schedule_refresh()
+            return self.creds
+
+    def _schedule_refresh(self, delay: Optional[float] = None):
+        """Refresh in the background refresh_margin seconds before the token expires. Caller holds _lock."""
+        if delay is None:
+            if self.creds is None or self.creds.expiry is None or not self.creds.refresh_token:
+                return
+            # google-auth keeps expiry as naive UTC
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            delay = max((self.creds.expiry - now).total_seconds() - self.refresh_margin, 0)
+
+        self._timer = threading.Timer(delay, self._refresh_in_background)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh_in_background(self):
+        from google.auth.transport.requests import Request
+
+        with self._lock:
+            try:
+                self.creds.refresh(Request())
+                self._save_token()
+                self._schedule_refresh()
+            except Exception as e:
+                print(f"Error refreshing Google credentials: {e}")
+                self._schedule_refresh(60.0)
+
+    @contextmanager
+    def http(self) -> Iterator[Any]:
+        """
+        An authorized HTTP connection for one request. httplib2 connections are
+        not thread-safe, so each is used by one thread at a time and returned
+        to the pool afterwards for any source to reuse.
+        """
+        with self._lock:
+            http = self._idle.pop() if self._idle else None
+        if http is None:
+            import httplib2
+            from google_auth_httplib2 import AuthorizedHttp
+
+            http = AuthorizedHttp(self.get_credentials(), http=httplib2.Http())
+
+        try:
+            yield http
+        finally:
+            with self._lock:
+                if len(self._idle) < self.max_idle_connections:
+                    self._idle.append(http)
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._idle.clear()
@@ -1,30 +1,241 @@
 from datetime import datetime
 
 from datetime import datetime
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional, Tuple
+from time import monotonic
+import os
+import threading
+from .record_store import RecordStore
 
 class DataSource:
     """Base class for all data sources (Calendar, Email, Tasks)."""
+
+    # Human-readable name used when reporting on this source
+    name = "Data source"
+    # Seconds a single fetch may take before the turn goes on without it
+    fetch_timeout = 10.0
+    # Seconds cached data is served as fresh
+    cache_ttl = 30.0
+    # Seconds past the TTL that cached data may still be served while it is
+    # refreshed in the background (None: no limit)
+    max_staleness: Optional[float] = 300.0
+    # Record fields whose change is worth telling the user about
+    # (new records always are)
+    notable_fields: tuple = ()
     
     def __init__(self):
         self.last_updated: Optional[datetime] = None
+        self.creds = None
+
+        # The API client is built on first use (see service)
+        self._service: Any = None
+        self._service_ready = False
+        self._service_lock = threading.Lock()
+        self.init_time: Optional[float] = None
+
+        # Stale-while-revalidate cache of the last fetch
+        self._cache_lock = threading.Lock()
+        self._fetch_lock = threading.Lock()  # _fetch_data never runs twice at once
+        self._cached_data: Any = None
+        self._cached_output: Optional[str] = None
+        self._cached_store: Optional[RecordStore] = None
+        # (record id, etag) -> rendered text, so unchanged records are not rendered again
+        self._rendered: Dict[Tuple[str, Optional[str]], str] = {}
+        self._cached_at: Optional[float] = None
+        self._refreshing = False
+        self.cache_hits = 0
+        self.cache_stale_hits = 0
+        self.cache_misses = 0
         
+    @property
+    def service(self) -> Any:
+        """
+        The API client, built by _initialize_service on first use. Authenticating
+        and loading the Google client libraries are slow, so a source costs
+        nothing at startup until something needs it.
+        """
+        if not self._service_ready:
+            with self._service_lock:
+                if not self._service_ready:
+                    started = monotonic()
+                    self._service = self._initialize_service()
+                    self._service_ready = True
+                    self.init_time = monotonic() - started
+                    if os.getenv("DEBUG") == "enabled":
+                        print(f"---\nDEBUG - {self.name} initialized in {self.init_time:.2f}s\n---\n")
+        return self._service
+
     def get_data(self) -> str:
         """
         Fetch and format data from the source.
         Returns formatted string representation of the data.
         """
+        return self._get_cached()[1]
+
+    def get_records(self) -> Any:
+        """Return the raw data behind get_data, from the same cache."""
+        return self._get_cached()[0]
+
+    def get_snapshot(self) -> tuple[Any, str]:
+        """Return both the raw data and its formatted string, from the same cache."""
+        return self._get_cached()
+
+    def get_store(self) -> RecordStore:
+        """The records behind get_data, indexed by _index_records, from the same cache."""
+        data, _ = self._get_cached()
+        with self._cache_lock:
+            if self._cached_data is data and self._cached_store is not None:
+                return self._cached_store
+        # The cache moved on since; index what was returned
+        return self._index_records(data)
+
+    def record_id(self, record: Any) -> str:
+        """Stable identifier of one record, used to match records between fetches."""
+        record_id = record.get('id') if isinstance(record, dict) else getattr(record, 'id', None)
+        return str(record_id) if record_id else repr(record)
+
+    def record_text(self, record: Any) -> str:
+        """Searchable text of one record, used by the retrieval index."""
+        return str(record)
+
+    def get_tools(self) -> List[Dict]:
+        """
+        Functions the LLM may call to read this source on demand. Each is a dict
+        with 'name', 'description', JSON-schema 'parameters' and the 'function' to run.
+        """
+        return []
+
+    def format_records(self, records: Any) -> str:
+        """Format any selection of this source's records the way get_data would."""
+        return self._format_data(records)
+
+    def _render_key(self, record: Any) -> Tuple[str, Optional[str]]:
+        return self.record_id(record), getattr(record, 'etag', None)
+
+    def render_record(self, record: Any) -> str:
+        """One record as _format_data writes it, rendered once per record version."""
+        key = self._render_key(record)
+        text = self._rendered.get(key)
+        if text is None:
+            text = self._rendered[key] = self._render_record(record)
+        return text
+
+    def _render_record(self, record: Any) -> str:
+        """
+        Render a single record for render_record.
+        Can be overridden by child classes.
+        """
+        return str(record) + "\n"
+
+    def _get_cached(self) -> tuple[Any, str]:
+        """
+        Serve (data, formatted output) from the cache when possible.
+        Fresh entries are returned as is; stale ones within max_staleness are
+        returned immediately while a background refresh runs; anything else
+        is fetched before returning.
+        """
+        with self._cache_lock:
+            if self._cached_at is not None:
+                age = monotonic() - self._cached_at
+                if age <= self.cache_ttl:
+                    self.cache_hits += 1
+                    return self._cached_data, self._cached_output
+                if self.max_staleness is None or age <= self.cache_ttl + self.max_staleness:
+                    self.cache_stale_hits += 1
+                    self._start_background_refresh()
+                    return self._cached_data, self._cached_output
+            self.cache_misses += 1
+
+        with self._fetch_lock:
+            # Another caller may have filled the cache while this one waited
+            with self._cache_lock:
+                if self._cached_at is not None and monotonic() - self._cached_at <= self.cache_ttl:
+                    return self._cached_data, self._cached_output
+            return self._refresh_locked()
+
+    def refresh(self) -> tuple[Any, str]:
+        """Fetch from the source now and update the cache."""
+        with self._fetch_lock:
+            return self._refresh_locked()
+
+    def _refresh_locked(self) -> tuple[Any, str]:
+        """Fetch and cache; if the fetch raises, the last good entry stays cached."""
         data = self._fetch_data()
-        self.last_updated = datetime.now()
-        return self._format_data(data)
+        output = self._format_data(data)
+        store = self._index_records(data)
+        if isinstance(data, list):
+            # Forget renderings of records that are gone or have changed
+            current = {self._render_key(record) for record in data}
+            self._rendered = {key: text for key, text in self._rendered.items() if key in current}
+        with self._cache_lock:
+            self._cached_data = data
+            self._cached_output = output
+            self._cached_store = store
+            self._cached_at = monotonic()
+            self.last_updated = datetime.now()
+        return data, output
+
+    def _start_background_refresh(self):
+        """Refresh on a daemon thread unless a refresh is already running. Caller holds _cache_lock."""
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing {self.name}: {e}")
+            finally:
+                with self._cache_lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name=f"refresh-{self.name}", daemon=True).start()
+
+    def invalidate(self):
+        """Drop the cached data so the next get_data fetches from the source."""
+        with self._cache_lock:
+            self._cached_data = None
+            self._cached_output = None
+            self._cached_store = None
+            self._cached_at = None
+
+    def cache_age(self) -> Optional[float]:
+        """Seconds since the cached data was fetched, or None if nothing is cached."""
+        with self._cache_lock:
+            return None if self._cached_at is None else monotonic() - self._cached_at
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Hit/miss counters for the cache."""
+        with self._cache_lock:
+            return {
+                'hits': self.cache_hits,
+                'stale_hits': self.cache_stale_hits,
+                'misses': self.cache_misses
+            }
     
+    def _initialize_service(self) -> Any:
+        """
+        Authenticate and build the API client, if the source uses one.
+        Can be overridden by child classes.
+        """
+        return None
+
     def _fetch_data(self) -> Any:
         """
         Fetch raw data from the source.
-        Must be implemented by child classes.
+        Must be implemented by child classes. Failures must raise: whatever
+        is returned is cached, diffed and reported as the source's real state.
         """
         raise NotImplementedError
     
+    def _index_records(self, data: Any) -> RecordStore:
+        """
+        Index freshly fetched records for the source's query helpers; runs once per sync.
+        Can be overridden by child classes.
+        """
+        return RecordStore(data if isinstance(data, list) else [])
+
     def _format_data(self, data: Any) -> str:
         """
         Format raw data into a readable string.
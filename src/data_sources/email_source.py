@@ -1,198 +1,278 @@
-from .data_source import DataSource
+from .google_source import GoogleSource
+from .record_store import RecordStore
+from .records import Email
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from typing import List, Dict, Optional, Set
+from googleapiclient.errors import HttpError
 import os
-import pickle
-from email.utils import parsedate_to_datetime
+from email.utils import parseaddr, parsedate_to_datetime
+
+class GmailSource(GoogleSource):
+    name = "Gmail"
+    api = "gmail"
+    api_version = "v1"
+    # Only the headers _parse_email_message reads are requested
+    METADATA_HEADERS = ['From', 'Subject', 'Date']
+    # Gmail advises keeping batches at or below 50 calls to avoid rate limiting
+    BATCH_SIZE = 50
 
-class GmailSource(DataSource):
     def __init__(self):
         super().__init__()
-        self.SCOPES = [
-            'https://www.googleapis.com/auth/gmail.readonly',
-            'https://www.googleapis.com/auth/calendar.readonly',
-            'https://www.googleapis.com/auth/tasks.readonly'
-        ]
-        self.max_emails = 20  # Only fetch last 20 emails for context (used to be 5)
-        self.service = self._initialize_service()
+        # Only fetch the most recent emails for context (used to be 5)
+        self.max_emails = int(os.getenv('GMAIL_MAX_EMAILS', '20'))
+        self.max_cached_messages = 500
+        self._message_cache: Dict[str, Email] = {}  # message id -> parsed message
+
+        # Incremental sync state: the unread inbox is tracked locally and kept
+        # current with users().history().list instead of being re-listed
+        self.incremental = True
+        self._history_id: Optional[str] = None
+        self._unread_ids: Set[str] = set()
+        self._unread_truncated = False  # the last full listing had more pages
     
-    def _initialize_service(self):
-        """Initialize and return the Gmail service."""
-        # Token file stores the user's access and refresh tokens
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        token_path = os.path.join(current_dir, 'token_gmail.pickle')
-        credentials_path = os.path.join(current_dir, 'credentials.json')
-
-        creds = None
-        # Load existing credentials if available
-        if os.path.exists(token_path):
-            with open(token_path, 'rb') as token:
-                creds = pickle.load(token)
-
-        # If there are no valid credentials available, authenticate
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                if not os.path.exists(credentials_path):
-                    raise FileNotFoundError(
-                        "credentials.json not found. Download it from Google Cloud Console."
-                    )
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    credentials_path, self.SCOPES
-                )
-                creds = flow.run_local_server(port=0)
-
-            # Save the credentials for the next run
-            with open(token_path, 'wb') as token:
-                pickle.dump(creds, token)
-
-        return build('gmail', 'v1', credentials=creds)
-
-    def _parse_email_message(self, message) -> Dict:
+    def _parse_email_message(self, message) -> Optional[Email]:
         """Parse Gmail message into a more usable format."""
         try:
             payload = message['payload']
-            headers = payload.get('headers', [])
-            
-            # Extract basic info from headers
-            email_data = {
-                'id': message['id'],
-                'from': next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown'),
-                'subject': next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No Subject'),
-                'date': next((h['value'] for h in headers if h['name'].lower() == 'date'), None),
-                'snippet': message.get('snippet', '')
-            }
-            
-            # # Convert date string to datetime
-            # if email_data['date']:
-            #     try:
-            #         email_data['date'] = parsedate_to_datetime(email_data['date'])
-            #     except Exception:
-            #         email_data['date'] = datetime.now()
-            
-            
-             # Convert date string to timezone-aware datetime
-            if email_data['date']:
-                try:
-                    # parsedate_to_datetime already returns timezone-aware datetime
-                    email_data['date'] = parsedate_to_datetime(email_data['date'])
-                except Exception:
-                    # Ensure fallback datetime is timezone-aware
-                    email_data['date'] = datetime.now(timezone.utc)
-            else:
-                # Ensure default datetime is timezone-aware
-                email_data['date'] = datetime.now(timezone.utc)
-            
-            return email_data
-            
+            headers = {}
+            for h in payload.get('headers', []):
+                headers.setdefault(h['name'].lower(), h['value'])
+
+            # Convert date string to timezone-aware datetime
+            try:
+                # parsedate_to_datetime already returns timezone-aware datetime
+                date = parsedate_to_datetime(headers['date'])
+            except Exception:
+                # Ensure fallback datetime is timezone-aware
+                date = datetime.now(timezone.utc)
+
+            return Email(
+                id=message['id'],
+                sender=headers.get('from', 'Unknown'),
+                subject=headers.get('subject', 'No Subject'),
+                date=date,
+                snippet=message.get('snippet', '')
+            )
+
         except Exception as e:
             print(f"Error parsing email message: {e}")
-            return {
-                'from': 'Error parsing email',
-                'subject': 'Parse error',
-                'date': datetime.now(timezone.utc),
-                'snippet': 'Error occurred while parsing this email'
-            }
+            return None
     
-    def _fetch_data(self) -> List[Dict]:
+    def _get_messages(self, message_ids: List[str]) -> List[Email]:
+        """
+        Return parsed messages for the given IDs, in the same order.
+        Messages not seen before are fetched with batched metadata-only requests.
+        """
+        missing = [msg_id for msg_id in dict.fromkeys(message_ids) if msg_id not in self._message_cache]
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                print(f"Error fetching email {request_id}: {exception}")
+                return
+            self._cache_message(self._parse_email_message(response))
+
+        def get_message(msg_id):
+            return self.service.users().messages().get(
+                userId='me',
+                id=msg_id,
+                format='metadata',
+                metadataHeaders=self.METADATA_HEADERS
+            )
+
+        for i in range(0, len(missing), self.BATCH_SIZE):
+            # Items the API throttles inside a batch are retried by the scheduler
+            self._execute_batch(missing[i:i + self.BATCH_SIZE], get_message, on_response)
+
+        return [self._message_cache[msg_id] for msg_id in message_ids if msg_id in self._message_cache]
+
+    def _cache_message(self, message: Optional[Email]):
+        """Store a parsed message, evicting the oldest entries once the cache is full."""
+        if message is None:  # parse failures are not worth keeping
+            return
+        self._message_cache[message.id] = message
+        while len(self._message_cache) > self.max_cached_messages:
+            self._message_cache.pop(next(iter(self._message_cache)))
+
+    def _full_sync(self):
+        """List the unread inbox from scratch and remember where history starts."""
+        # Read the history ID first so nothing that changes during the listing is missed
+        profile = self._execute(self.service.users().getProfile(userId='me'))
+
+        results = self._execute(self.service.users().messages().list(
+            userId='me',
+            maxResults=self.max_emails,
+            q='in:inbox is:unread'
+        ))
+
+        self._unread_ids = {msg['id'] for msg in results.get('messages', [])}
+        self._unread_truncated = 'nextPageToken' in results
+        self._history_id = profile['historyId']
+
+    def _sync_history(self):
+        """Apply every mailbox change recorded since the last known history ID."""
+        page_token = None
+        while True:
+            results = self._execute(self.service.users().history().list(
+                userId='me',
+                startHistoryId=self._history_id,
+                pageToken=page_token
+            ))
+
+            for record in results.get('history', []):
+                self._apply_history_record(record)
+
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+
+        self._history_id = results.get('historyId', self._history_id)
+
+    def _apply_history_record(self, record: Dict):
+        """Update the tracked unread inbox from a single history record."""
+        for change in record.get('messagesDeleted', []):
+            self._unread_ids.discard(change['message']['id'])
+
+        for key in ('messagesAdded', 'labelsAdded', 'labelsRemoved'):
+            for change in record.get(key, []):
+                message = change['message']
+                labels = message.get('labelIds', [])
+                if 'INBOX' in labels and 'UNREAD' in labels:
+                    self._unread_ids.add(message['id'])
+                else:
+                    self._unread_ids.discard(message['id'])
+
+    def _sync(self):
+        """Bring the tracked unread inbox up to date, incrementally when possible."""
+        if not self.incremental or self._history_id is None:
+            self._full_sync()
+            return
+
+        try:
+            self._sync_history()
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            # The history ID is too old for Gmail to answer from; start over
+            self._full_sync()
+            return
+
+        # Messages left the tracked set and older unread mail was never listed
+        if self._unread_truncated and len(self._unread_ids) < self.max_emails:
+            self._full_sync()
+
+    def _fetch_data(self) -> List[Email]:
         """Fetch emails from Gmail API."""
         try:
-            # Get list of recent messages
-            results = self.service.users().messages().list(
-                userId='me',
-                maxResults=self.max_emails,
-                q='in:inbox is:unread'
-            ).execute()
-            
-            messages = results.get('messages', [])
-            detailed_messages = []
-            
-            # Get detailed information for each message
-            for msg in messages:
-                message_detail = self.service.users().messages().get(
-                    userId='me',
-                    id=msg['id']
-                ).execute()
-                
-                parsed_message = self._parse_email_message(message_detail)
-                detailed_messages.append(parsed_message)
+            self._sync()
+            detailed_messages = self._get_messages(list(self._unread_ids))
             
             # Sort by date, newest first
-            # detailed_messages.sort(
-            #     key=lambda x: x['date'] if isinstance(x['date'], datetime) else datetime.now(timezone.utc),
-            #     reverse=True
-            # )
-            def get_aware_date(msg):
-                date = msg['date']
-                if isinstance(date, datetime):
-                    if date.tzinfo is None:  # if naive
-                        return date.replace(tzinfo=timezone.utc)  # make it UTC aware
-                    return date
-                return datetime.now(timezone.utc)
-            
             detailed_messages.sort(
-                key=get_aware_date,
+                key=self._aware_date,
                 reverse=True
             )
 
             
+            if len(detailed_messages) > self.max_emails:
+                # Stop tracking older mail; a full sync brings it back if needed
+                detailed_messages = detailed_messages[:self.max_emails]
+                self._unread_ids = {msg.id for msg in detailed_messages}
+                self._unread_truncated = True
+
             return detailed_messages
             
         except Exception as e:
             print(f"Error fetching emails: {e}")
-            return []
+            raise
     
-    def _format_data(self, emails: List[Dict]) -> str:
+    @staticmethod
+    def _aware_date(email: Email) -> datetime:
+        if email.date.tzinfo is None:  # if naive
+            return email.date.replace(tzinfo=timezone.utc)  # make it UTC aware
+        return email.date
+
+    @staticmethod
+    def _sender_address(email: Email) -> str:
+        return parseaddr(email.sender)[1].lower()
+
+    def _index_records(self, emails: List[Email]) -> RecordStore:
+        return RecordStore(
+            emails,
+            sorted_by={'date': self._aware_date},
+            grouped_by={'sender': self._sender_address}
+        )
+
+    def _format_data(self, emails: List[Email]) -> str:
         if not emails:
             return "No recent emails found."
-        
-        formatted = "Recent Unread Emails:\n"
-        for email in emails:
-            date_str = email['date'].strftime("%Y-%m-%d %H:%M") if isinstance(email['date'], datetime) else 'Unknown date'
-            formatted += f"- From: {email['from']}\n"
-            formatted += f"  Subject: {email['subject']}\n"
-            formatted += f"  Date: {date_str}\n"
-            formatted += f"  Preview: {email['snippet']}\n\n"
-        
-        return formatted
+
+        return "Recent Unread Emails:\n" + "".join(self.render_record(email) for email in emails)
+
+    def _render_record(self, email: Email) -> str:
+        return (
+            f"- From: {email.sender}\n"
+            f"  Subject: {email.subject}\n"
+            f"  Date: {email.date.strftime('%Y-%m-%d %H:%M')}\n"
+            f"  Preview: {email.snippet}\n\n"
+        )
+
+    def record_text(self, email: Email) -> str:
+        date = email.date.strftime("%A %B %d").replace(" 0", " ")
+        return f"email {email.sender} {email.subject} {email.snippet} {date}"
+
+    def get_tools(self) -> List[Dict]:
+        return [
+            {
+                'name': 'get_recent_emails_from',
+                'description': "List recent emails from a sender, read or unread.",
+                'parameters': {
+                    'type': 'object',
+                    'properties': {
+                        'sender': {'type': 'string', 'description': 'Sender name or email address'}
+                    },
+                    'required': ['sender']
+                },
+                'function': lambda sender: self.format_records(self.get_recent_from(sender))
+            },
+            {
+                'name': 'get_unread_email_count',
+                'description': "Count the unread emails in the user's inbox.",
+                'parameters': {'type': 'object', 'properties': {}},
+                'function': lambda: f"{self.get_unread_count()} unread emails in the inbox."
+            }
+        ]
 
     def get_unread_count(self) -> int:
         """Get count of unread emails."""
         try:
-            results = self.service.users().messages().list(
+            results = self._execute(self.service.users().messages().list(
                 userId='me',
                 q='in:inbox is:unread'
-            ).execute()
+            ))
             return len(results.get('messages', []))
         except Exception as e:
             print(f"Error getting unread count: {e}")
             return 0
 
-    def get_recent_from(self, sender: str) -> List[Dict]:
+    def get_unread_from(self, sender: str) -> List[Email]:
+        """Get the tracked unread emails from an email address, newest first."""
+        return self.get_store().group('sender', sender.lower())
+
+    def get_unread_since(self, since: datetime) -> List[Email]:
+        """Get the tracked unread emails received since a (timezone-aware) time, newest first."""
+        return list(reversed(self.get_store().range('date', low=since)))
+
+    def get_recent_from(self, sender: str) -> List[Email]:
         """Get recent emails from a specific sender."""
         try:
-            results = self.service.users().messages().list(
+            results = self._execute(self.service.users().messages().list(
                 userId='me',
+                maxResults=self.max_emails,
                 q=f'from:{sender}'
-            ).execute()
+            ))
             
             messages = results.get('messages', [])[:self.max_emails]
-            detailed_messages = []
-            
-            for msg in messages:
-                message_detail = self.service.users().messages().get(
-                    userId='me',
-                    id=msg['id']
-                ).execute()
-                parsed_message = self._parse_email_message(message_detail)
-                detailed_messages.append(parsed_message)
-                
-            return detailed_messages
+            return self._get_messages([msg['id'] for msg in messages])
             
         except Exception as e:
             print(f"Error fetching emails from {sender}: {e}")
@@ -0,0 +1,48 @@
+from typing import Any, Callable, List, Optional
+from .credentials import CredentialManager
+from .data_source import DataSource
+from .request_scheduler import RequestScheduler
+
+class GoogleSource(DataSource):
+    """
+    Base class for the sources backed by a Google API. They share one
+    CredentialManager and send their requests through the shared
+    RequestScheduler.
+    """
+
+    # Google API the source calls, as named by googleapiclient's build();
+    # also picks its rate limit (see request_scheduler)
+    api: Optional[str] = None
+    api_version: Optional[str] = None
+
+    def __init__(self):
+        super().__init__()
+        self.credentials = CredentialManager.shared()
+
+    def _initialize_service(self) -> Any:
+        """Authenticate and build the API client."""
+        from googleapiclient.discovery import build
+
+        self.creds = self.credentials.get_credentials()
+        return build(self.api, self.api_version, credentials=self.creds, static_discovery=True, cache_discovery=False)
+
+    def _execute(self, request):
+        """
+        Execute a Google API request through the shared request scheduler, on
+        a connection from the shared pool, which every source uses and keeps authorized.
+        """
+        return RequestScheduler.shared().execute(self.api, request, self._send)
+
+    def _send(self, request):
+        with self.credentials.http() as http:
+            return request.execute(http=http)
+
+    def _execute_batch(self, request_ids: List[str], build_request: Callable[[str], Any],
+                       on_response: Callable[[str, Any, Any], None]):
+        """
+        Execute build_request(id) for each ID as a batch through the shared request
+        scheduler, which retries items the API throttled.
+        """
+        RequestScheduler.shared().execute_batch(
+            self.api, request_ids, build_request, self.service.new_batch_http_request, on_response, self._send
+        )
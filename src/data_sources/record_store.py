@@ -0,0 +1,57 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+class RecordStore:
+    """
+    A source's records from one sync, indexed for the questions its helpers
+    answer. Sorted indexes answer range queries by binary search; group
+    indexes map a key to its records. An index key of None leaves a record
+    out of that index.
+    """
+
+    def __init__(self, records: List[Any],
+                 sorted_by: Optional[Dict[str, Callable[[Any], Any]]] = None,
+                 grouped_by: Optional[Dict[str, Callable[[Any], Any]]] = None):
+        self.records = records
+        # index name -> (sorted keys, records in the same order)
+        self._sorted: Dict[str, tuple] = {}
+        self._groups: Dict[str, Dict[Any, List[Any]]] = {}
+
+        for name, key in (sorted_by or {}).items():
+            entries = [(key(record), position) for position, record in enumerate(records)]
+            entries = sorted((entry for entry in entries if entry[0] is not None), key=lambda entry: entry[0])
+            self._sorted[name] = (
+                [value for value, _ in entries],
+                [records[position] for _, position in entries]
+            )
+
+        for name, key in (grouped_by or {}).items():
+            groups: Dict[Any, List[Any]] = {}
+            for record in records:
+                value = key(record)
+                if value is not None:
+                    groups.setdefault(value, []).append(record)
+            self._groups[name] = groups
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.records)
+
+    def range(self, index: str, low: Any = None, high: Any = None) -> List[Any]:
+        """Records whose key is between low and high (inclusive; None is unbounded), in key order."""
+        keys, records = self._sorted[index]
+        start = 0 if low is None else bisect_left(keys, low)
+        end = len(keys) if high is None else bisect_right(keys, high)
+        return records[start:end]
+
+    def first_after(self, index: str, value: Any) -> Optional[Any]:
+        """The record with the smallest key greater than value."""
+        keys, records = self._sorted[index]
+        position = bisect_right(keys, value)
+        return records[position] if position < len(records) else None
+
+    def group(self, index: str, value: Any) -> List[Any]:
+        """Records whose key equals value."""
+        return self._groups[index].get(value, [])
@@ -0,0 +1,38 @@
+"""
+Compact record types for the data sources: only the fields Jarvis uses are
+kept from each API response, in slotted dataclasses.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+
+@dataclass(slots=True)
+class Email:
+    id: str
+    sender: str
+    subject: str
+    date: datetime
+    snippet: str
+
+@dataclass(slots=True)
+class Event:
+    id: str
+    calendar: str
+    summary: str
+    start: datetime
+    end: datetime
+    location: str = ''
+    description: str = ''
+    attendees: Tuple[str, ...] = ()
+    etag: Optional[str] = None
+
+@dataclass(slots=True)
+class Task:
+    id: str
+    title: str
+    status: str
+    tasklist_title: str
+    due: Optional[str] = None  # RFC 3339, as the API sends it
+    notes: str = ''
+    etag: Optional[str] = None
@@ -0,0 +1,218 @@
+from copy import deepcopy
+from time import monotonic, sleep
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from googleapiclient.errors import HttpError
+import json
+import os
+import random
+import threading
+
+# (requests per second, burst) per API, kept under Google's default per-user
+# quotas: Gmail allows 250 quota units a second (5 per messages.get/list),
+# Calendar and Tasks a few hundred requests a minute
+RATE_LIMITS = {
+    'gmail': (40.0, 50),
+    'calendar': (5.0, 10),
+    'tasks': (5.0, 10)
+}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+class TokenBucket:
+    """Allows rate requests a second on average and up to burst at once."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, cost: int = 1):
+        """Block until cost tokens are available, then take them."""
+        cost = min(cost, self.burst)
+        while True:
+            with self._lock:
+                now = monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.tokens >= cost:
+                        self.tokens -= cost
+                        return
+                    wait = (cost - self.tokens) / self.rate
+            sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hold every caller back after the API reported throttling."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, monotonic() + seconds)
+            self.tokens = 0.0
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+class RequestScheduler:
+    """
+    Shared gate for Google API requests: identical requests in flight at the
+    same time are sent once (singleflight), each API is held to a token-bucket
+    rate limit, and throttled requests are retried with jittered exponential
+    backoff.
+    """
+
+    _shared: Optional["RequestScheduler"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_retries: int = 5, backoff_base: float = 1.0, backoff_max: float = 32.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.buckets: Dict[str, TokenBucket] = {
+            api: TokenBucket(rate, burst) for api, (rate, burst) in RATE_LIMITS.items()
+        }
+        self.coalesced = 0
+        self.throttled = 0
+        self._flights: Dict[Tuple, _Flight] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "RequestScheduler":
+        """The process-wide scheduler used by the Google sources."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @staticmethod
+    def _key(request) -> Optional[Tuple]:
+        """What makes two requests identical; batches are never shared."""
+        uri = getattr(request, 'uri', None)
+        if uri is None:
+            return None
+        headers = getattr(request, 'headers', {}) or {}
+        return (request.method, uri, request.body, headers.get('If-None-Match'))
+
+    @staticmethod
+    def _cost(request) -> int:
+        """Quota cost: a batch counts every call in it."""
+        order = getattr(request, '_order', None)
+        return len(order) if order else 1
+
+    @staticmethod
+    def _is_throttled(error: HttpError) -> bool:
+        if error.resp.status == 429:
+            return True
+        if error.resp.status != 403:
+            return False
+        try:
+            details = json.loads(error.content.decode('utf-8')).get('error', {})
+        except (ValueError, AttributeError):
+            return False
+        return any(item.get('reason') in RATE_LIMIT_REASONS for item in details.get('errors', []))
+
+    def _retry_delay(self, attempt: int, error: HttpError) -> float:
+        """Full-jitter exponential backoff, or longer if the server says so."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        try:
+            delay = max(delay, float(error.resp.get('retry-after', 0)))
+        except (TypeError, ValueError):
+            pass
+        return delay
+
+    def _send(self, api: Optional[str], request, execute: Callable[[Any], Any]) -> Any:
+        bucket = self.buckets.get(api)
+        cost = self._cost(request)
+        for attempt in range(self.max_retries + 1):
+            if bucket is not None:
+                bucket.acquire(cost)
+            try:
+                return execute(request)
+            except HttpError as e:
+                # Anything else, including 304 Not Modified, is the caller's to handle
+                if not self._is_throttled(e) or attempt == self.max_retries:
+                    raise
+                self._back_off(api, attempt, e)
+
+    def _back_off(self, api: Optional[str], attempt: int, error: HttpError):
+        """Hold the API's callers back and wait before retry number attempt (0-based)."""
+        delay = self._retry_delay(attempt, error)
+        self.throttled += 1
+        bucket = self.buckets.get(api)
+        if bucket is not None:
+            bucket.pause(delay)
+        if os.getenv("DEBUG") == "enabled":
+            print(f"---\nDEBUG - {api} throttled, retry {attempt + 1}/{self.max_retries} in {delay:.1f}s\n---")
+        sleep(delay)
+
+    def execute(self, api: Optional[str], request, execute: Callable[[Any], Any]) -> Any:
+        """
+        Run execute(request) under the given API's rate limit. A caller asking
+        for a request that is already in flight waits for it and gets a copy
+        of its result instead of sending it again.
+        """
+        key = self._key(request)
+        if key is None:
+            return self._send(api, request, execute)
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.followers += 1
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return deepcopy(flight.result)
+
+        try:
+            flight.result = self._send(api, request, execute)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        # The original stays untouched for followers still copying it
+        return deepcopy(flight.result) if flight.followers else flight.result
+
+    def execute_batch(self, api: Optional[str], request_ids: List[str], build_request: Callable[[str], Any],
+                      new_batch: Callable[[Callable], Any], on_response: Callable[[str, Any, Any], None],
+                      execute: Callable[[Any], Any]):
+        """
+        Send build_request(request_id) for each ID in batches made by
+        new_batch(callback), passing each outcome to on_response(request_id,
+        response, exception). Batches report throttling per item; throttled
+        items are sent again in a new batch after the same backoff as
+        throttled requests, until the retries run out.
+        """
+        pending = list(request_ids)
+        for attempt in range(self.max_retries + 1):
+            throttled: Dict[str, HttpError] = {}
+
+            def callback(request_id, response, exception):
+                if (isinstance(exception, HttpError) and self._is_throttled(exception)
+                        and attempt < self.max_retries):
+                    throttled[request_id] = exception
+                else:
+                    on_response(request_id, response, exception)
+
+            batch = new_batch(callback=callback)
+            for request_id in pending:
+                batch.add(build_request(request_id), request_id=request_id)
+            self.execute(api, batch, execute)
+
+            if not throttled:
+                return
+            pending = [request_id for request_id in pending if request_id in throttled]
+            self._back_off(api, attempt, next(iter(throttled.values())))
@@ -1,172 +1,259 @@
-from .data_source import DataSource
-from datetime import datetime, timedelta
-from typing import List, Dict
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-import os
-import pickle
-
-class GoogleTasksSource(DataSource):
+from .google_source import GoogleSource
+from .record_store import RecordStore
+from .records import Task
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Optional
+from googleapiclient.errors import HttpError
+
+class GoogleTasksSource(GoogleSource):
+    name = "Tasks"
+    api = "tasks"
+    api_version = "v1"
+    cache_ttl = 60.0
+    notable_fields = ('due',)
+
     def __init__(self):
         super().__init__()
-        self.SCOPES = [
-            'https://www.googleapis.com/auth/tasks.readonly',
-            'https://www.googleapis.com/auth/calendar.readonly',
-            'https://www.googleapis.com/auth/gmail.readonly'
-        ]
-        self.creds = None
-        self.service = self._initialize_service()
+        self.max_workers = 4  # task lists fetched in parallel
+        self.page_size = 100
+
+        # Tasks kept between turns: list id -> {'title', 'updated_min', 'etag', 'tasks': {task id: Task}}.
+        # After a full fetch each list is only asked for tasks updated since
+        # updated_min, with the last ETag so an unchanged list answers 304.
+        self._lists: Dict[str, Dict] = {}
+        self._tasklists_etag: Optional[str] = None
+        self._merged_tasks: Optional[List[Task]] = None
         
-    def _initialize_service(self):
-        """Initialize and return the Google Tasks service."""
-        """Initialize and return the Google Tasks service."""
-        # Update paths to be relative to this file
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        token_path = os.path.join(current_dir, 'token_tasks.pickle')
-        credentials_path = os.path.join(current_dir, 'credentials.json')
-
-        # Load existing credentials if available
-        if os.path.exists(token_path):
-            with open(token_path, 'rb') as token:
-                self.creds = pickle.load(token)
-
-        # If there are no valid credentials available, authenticate
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                self.creds.refresh(Request())
+    @staticmethod
+    def _is_not_modified(error: HttpError) -> bool:
+        return error.resp.status == 304
+
+    def _sync_tasklists(self) -> bool:
+        """Refresh the known task lists. Returns True if any list was added or removed."""
+        request = self.service.tasklists().list(maxResults=self.page_size)
+        if self._tasklists_etag and self._lists:
+            request.headers['If-None-Match'] = self._tasklists_etag
+
+        try:
+            result = self._execute(request)
+        except HttpError as e:
+            if self._is_not_modified(e):
+                return False
+            raise
+
+        tasklists = result.get('items', [])
+        # The ETag only describes this page, so it is only reused when there is no other
+        self._tasklists_etag = result.get('etag') if 'nextPageToken' not in result else None
+        while 'nextPageToken' in result:
+            result = self._execute(self.service.tasklists().list(
+                maxResults=self.page_size,
+                pageToken=result['nextPageToken']
+            ))
+            tasklists.extend(result.get('items', []))
+
+        current_ids = {tasklist['id'] for tasklist in tasklists}
+        changed = set(self._lists) != current_ids
+        for list_id in set(self._lists) - current_ids:
+            del self._lists[list_id]
+
+        for tasklist in tasklists:
+            state = self._lists.setdefault(tasklist['id'], {
+                'title': tasklist['title'],
+                'updated_min': None,
+                'etag': None,
+                'tasks': {}
+            })
+            if state['title'] != tasklist['title']:
+                state['title'] = tasklist['title']
+                state['tasks'] = {
+                    task_id: replace(task, tasklist_title=tasklist['title'])
+                    for task_id, task in state['tasks'].items()
+                }
+                changed = True
+
+        return changed
+
+    def _sync_tasklist(self, list_id: str) -> bool:
+        """Fetch one list's tasks, or just its changes. Returns True if anything changed."""
+        state = self._lists[list_id]
+        incremental = state['updated_min'] is not None
+        # Leave a margin for clock skew; re-applying a change is harmless
+        sync_started = (datetime.now(timezone.utc) - timedelta(minutes=1)).isoformat().replace('+00:00', 'Z')
+
+        params = {
+            'tasklist': list_id,
+            'showCompleted': True,
+            'showHidden': False,
+            'maxResults': self.page_size
+        }
+        if incremental:
+            # Deleted and newly hidden tasks must be seen to be removed
+            params.update(updatedMin=state['updated_min'], showDeleted=True, showHidden=True)
+
+        request = self.service.tasks().list(**params)
+        if incremental and state['etag']:
+            request.headers['If-None-Match'] = state['etag']
+
+        try:
+            result = self._execute(request)
+        except HttpError as e:
+            if self._is_not_modified(e):
+                return False
+            raise
+
+        tasks = result.get('items', [])
+        single_page = 'nextPageToken' not in result
+        while 'nextPageToken' in result:
+            result = self._execute(self.service.tasks().list(pageToken=result['nextPageToken'], **params))
+            tasks.extend(result.get('items', []))
+
+        if not incremental:
+            state['tasks'] = {}
+
+        for task in tasks:
+            if task.get('deleted') or task.get('hidden'):
+                state['tasks'].pop(task['id'], None)
             else:
-                if not os.path.exists(credentials_path):
-                    raise FileNotFoundError(
-                        "credentials.json not found. Download it from Google Cloud Console."
-                    )
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    credentials_path, self.SCOPES
+                state['tasks'][task['id']] = Task(
+                    id=task['id'],
+                    title=task.get('title', 'Untitled Task'),
+                    status=task.get('status', 'unknown'),
+                    tasklist_title=state['title'],
+                    due=task.get('due'),
+                    notes=task.get('notes', ''),
+                    etag=task.get('etag')
                 )
-                self.creds = flow.run_local_server(port=0)
 
-            # Save the credentials for the next run
-            with open(token_path, 'wb') as token:
-                pickle.dump(self.creds, token)
+        if tasks or not incremental:
+            # Move the watermark forward; the next request learns the new ETag
+            state['updated_min'] = sync_started
+            state['etag'] = None
+            return True
 
-        return build('tasks', 'v1', credentials=self.creds)
+        # Nothing changed since the watermark; keep it so the ETag stays valid
+        state['etag'] = result.get('etag') if single_page else None
+        return False
 
-    def _fetch_data(self) -> List[Dict]:
+    def _fetch_data(self) -> List[Task]:
         """Fetch tasks from Google Tasks API."""
         try:
-            # First, get all task lists
-            tasklists_result = self.service.tasklists().list().execute()
-            tasklists = tasklists_result.get('items', [])
-            
-            all_tasks = []
-            
-            # Get tasks from each task list
-            for tasklist in tasklists:
-                tasklist_id = tasklist['id']
-                tasklist_title = tasklist['title']
-                
-                # Get tasks from this list
-                tasks_result = self.service.tasks().list(
-                    tasklist=tasklist_id,
-                    showCompleted=True,
-                    showHidden=False
-                ).execute()
-                
-                tasks = tasks_result.get('items', [])
-                
-                # Add task list title to each task
-                for task in tasks:
-                    task['tasklistTitle'] = tasklist_title
-                    
-                all_tasks.extend(tasks)
-            
-            # Sort tasks by due date if available
-            all_tasks.sort(
-                key=lambda x: x.get('due', '9999-12-31'),
-                reverse=False
-            )
-            
-            return all_tasks
+            changed = self._sync_tasklists()
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results = list(pool.map(self._sync_tasklist, list(self._lists)))
+            changed = changed or any(results)
+
+            if changed or self._merged_tasks is None:
+                all_tasks = [
+                    task
+                    for state in self._lists.values()
+                    for task in state['tasks'].values()
+                ]
+                # Sort tasks by due date if available
+                all_tasks.sort(
+                    key=lambda x: x.due or '9999-12-31',
+                    reverse=False
+                )
+                self._merged_tasks = all_tasks
+
+            return list(self._merged_tasks)
 
         except Exception as e:
             print(f"Error fetching tasks: {e}")
-            return []
+            raise
     
 
-    def _format_data(self, tasks: List[Dict]) -> str:
+    @staticmethod
+    def _due(task: Task) -> Optional[datetime]:
+        try:
+            return datetime.fromisoformat(task.due.replace('Z', '+00:00'))
+        except (AttributeError, ValueError):
+            return None
+
+    def _index_records(self, tasks: List[Task]) -> RecordStore:
+        return RecordStore(
+            tasks,
+            sorted_by={
+                'pending_due': lambda task: self._due(task) if task.status != 'completed' else None
+            },
+            grouped_by={'completed': lambda task: task.status == 'completed'}
+        )
+
+    def _format_data(self, tasks: List[Task]) -> str:
         """Format tasks into a readable string."""
         if not tasks:
             return "No tasks found."
-        
-        formatted = "Tasks:\n"
-        
+
         # Group tasks by task list
-        tasks_by_list = {}
+        tasks_by_list: Dict[str, List[Task]] = {}
         for task in tasks:
-            list_title = task.get('tasklistTitle', 'Default')
-            if list_title not in tasks_by_list:
-                tasks_by_list[list_title] = []
-            tasks_by_list[list_title].append(task)
-        
+            tasks_by_list.setdefault(task.tasklist_title or 'Default', []).append(task)
+
         # Format tasks by list
+        parts = ["Tasks:\n"]
         for list_title, list_tasks in tasks_by_list.items():
-            formatted += f"\n{list_title}:\n"
-            for task in list_tasks:
-                # Get task details
-                title = task.get('title', 'Untitled Task')
-                due_date = task.get('due', 'No due date')
-                if due_date != 'No due date':
-                    # Convert Google's datetime format to more readable form
-                    try:
-                        due_dt = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-                        due_date = due_dt.strftime('%Y-%m-%d')
-                    except ValueError:
-                        pass  # Keep original format if parsing fails
-                
-                status = task.get('status', 'unknown')
-                notes = task.get('notes', '')
-                
-                # Format the task line
-                task_line = f"  - {title}"
-                if due_date != 'No due date':
-                    task_line += f" (Due: {due_date})"
-                if status == 'completed':
-                    task_line += " ✓"
-                task_line += "\n"
-                
-                # Add notes if they exist
-                if notes:
-                    task_line += f"    Notes: {notes}\n"
-                
-                formatted += task_line
-        
-        return formatted
+            parts.append(f"\n{list_title}:\n")
+            parts.extend(self.render_record(task) for task in list_tasks)
 
-    def get_completed_tasks(self) -> List[Dict]:
+        return "".join(parts)
+
+    def _render_record(self, task: Task) -> str:
+        # Format the task line
+        task_line = f"  - {task.title}"
+        if task.due:
+            # Convert Google's datetime format to more readable form
+            due = self._due(task)
+            task_line += f" (Due: {due.strftime('%Y-%m-%d') if due else task.due})"
+        if task.status == 'completed':
+            task_line += " ✓"
+        task_line += "\n"
+
+        # Add notes if they exist
+        if task.notes:
+            task_line += f"    Notes: {task.notes}\n"
+
+        return task_line
+
+    def record_text(self, task: Task) -> str:
+        due = self._due(task)
+        return " ".join([
+            "task", task.title, task.notes, task.tasklist_title,
+            "due " + due.strftime("%A %B %d").replace(" 0", " ") if due else (task.due or ''),
+            task.status
+        ])
+
+    def get_tools(self) -> List[Dict]:
+        return [
+            {
+                'name': 'get_pending_tasks',
+                'description': "List the user's tasks that are not completed yet.",
+                'parameters': {'type': 'object', 'properties': {}},
+                'function': lambda: self.format_records(self.get_pending_tasks())
+            },
+            {
+                'name': 'get_tasks_due_soon',
+                'description': "List the user's unfinished tasks due within a number of days.",
+                'parameters': {
+                    'type': 'object',
+                    'properties': {
+                        'days': {'type': 'integer', 'description': 'How many days ahead to look (default 7)'}
+                    }
+                },
+                'function': lambda days=7: self.format_records(self.get_tasks_due_soon(int(days)))
+            }
+        ]
+
+    def get_completed_tasks(self) -> List[Task]:
         """Get only completed tasks."""
-        tasks = self._fetch_data()
-        return [task for task in tasks if task.get('status') == 'completed']
+        return self.get_store().group('completed', True)
 
-    def get_pending_tasks(self) -> List[Dict]:
+    def get_pending_tasks(self) -> List[Task]:
         """Get only pending tasks."""
-        tasks = self._fetch_data()
-        return [task for task in tasks if task.get('status') != 'completed']
+        return self.get_store().group('completed', False)
 
-    def get_tasks_due_soon(self, days: int = 7) -> List[Dict]:
+    def get_tasks_due_soon(self, days: int = 7) -> List[Task]:
         """Get tasks due within the specified number of days."""
-        tasks = self._fetch_data()
-        cutoff_date = datetime.now() + timedelta(days=days)
-        
-        due_soon = []
-        for task in tasks:
-            due_date = task.get('due')
-            if due_date:
-                try:
-                    task_due = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-                    if task_due <= cutoff_date and task.get('status') != 'completed':
-                        due_soon.append(task)
-                except ValueError:
-                    continue
-        
-        return due_soon
+        cutoff_date = datetime.now(timezone.utc) + timedelta(days=days)
+        return self.get_store().range('pending_due', high=cutoff_date)
@@ -0,0 +1,148 @@
+"""
+Pool of interchangeable LLM API endpoints (replicas serving the same model),
+with load balancing, health tracking and circuit breaking.
+"""
+
+import random
+import threading
+from collections import deque
+from time import monotonic
+from typing import Callable, Dict, Iterable, Optional
+
+class Endpoint:
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0  # requests sent and not yet finished
+        self.failures = 0  # consecutive
+        self.opened_at: Optional[float] = None  # when the circuit opened; None while closed
+        self.trial = False  # the one request allowed through a half-open circuit is in flight
+
+    def __repr__(self):
+        return f"Endpoint({self.url!r})"
+
+class EndpointPool:
+    """
+    Picks the healthy endpoint with the fewest outstanding requests.
+
+    After failure_threshold consecutive failures an endpoint's circuit opens
+    and it gets no traffic; once cooldown seconds have passed, one trial
+    request is let through, and its success closes the circuit again.
+    Active health checks (start_health_checks) open and close circuits
+    between requests as well.
+
+    Successful request latencies are kept per kind (e.g. streamed or not),
+    so hedge_delay can say when a request is slower than usual.
+    """
+
+    def __init__(self, urls: Iterable[str], failure_threshold: int = 3, cooldown: float = 30.0,
+                 window: int = 200, min_samples: int = 20):
+        self.endpoints = [Endpoint(url) for url in urls]
+        if not self.endpoints:
+            raise ValueError("No API endpoints configured")
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.window = window
+        self.min_samples = min_samples
+        self.latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def _available(self, endpoint: Endpoint, now: float) -> bool:
+        """Whether the endpoint may take a request. Caller holds _lock."""
+        if endpoint.opened_at is None:
+            return True
+        return not endpoint.trial and now - endpoint.opened_at >= self.cooldown
+
+    def acquire(self, exclude: Iterable[Endpoint] = (), fallback: bool = True) -> Optional[Endpoint]:
+        """
+        Reserve the least loaded available endpoint not in exclude. When every
+        circuit is open, the one open longest is tried anyway, unless fallback
+        is False, in which case None is returned.
+        """
+        with self._lock:
+            now = monotonic()
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+            available = [endpoint for endpoint in candidates if self._available(endpoint, now)]
+            if available:
+                fewest = min(endpoint.outstanding for endpoint in available)
+                endpoint = random.choice([endpoint for endpoint in available if endpoint.outstanding == fewest])
+            elif fallback and candidates:
+                endpoint = min(candidates, key=lambda endpoint: endpoint.opened_at)
+            else:
+                return None
+
+            if endpoint.opened_at is not None:
+                endpoint.trial = True
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint):
+        """The request reserved by acquire has finished."""
+        with self._lock:
+            endpoint.outstanding -= 1
+
+    def record(self, endpoint: Endpoint, ok: bool, latency: Optional[float] = None, kind: str = ""):
+        """Passive health check: the outcome of a request, and its latency if it succeeded."""
+        with self._lock:
+            endpoint.trial = False
+            if ok:
+                endpoint.failures = 0
+                endpoint.opened_at = None
+                if latency is not None:
+                    self.latencies.setdefault(kind, deque(maxlen=self.window)).append(latency)
+                return
+            endpoint.failures += 1
+            if endpoint.opened_at is not None or endpoint.failures >= self.failure_threshold:
+                # A failed trial waits out another cooldown
+                endpoint.opened_at = monotonic()
+
+    def hedge_delay(self, percentile: float, kind: str = "") -> Optional[float]:
+        """The given latency percentile for requests of this kind, once enough are recorded."""
+        with self._lock:
+            samples = sorted(self.latencies.get(kind, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(int(len(samples) * percentile / 100), len(samples) - 1)]
+
+    def check(self, probe: Callable[[Endpoint], bool]):
+        """Active health check: probe every endpoint and open or close its circuit."""
+        for endpoint in self.endpoints:
+            try:
+                healthy = probe(endpoint)
+            except Exception:
+                healthy = False
+            with self._lock:
+                if healthy:
+                    endpoint.failures = 0
+                    endpoint.opened_at = None
+                elif endpoint.opened_at is None:
+                    endpoint.failures = self.failure_threshold
+                    endpoint.opened_at = monotonic()
+
+    def start_health_checks(self, probe: Callable[[Endpoint], bool], interval: float):
+        """Run check(probe) every interval seconds on a daemon timer."""
+        def run():
+            self.check(probe)
+            with self._lock:
+                if not self._closed:
+                    self._schedule(run, interval)
+
+        with self._lock:
+            self._schedule(run, interval)
+
+    def _schedule(self, func: Callable[[], None], delay: float):
+        """Caller holds _lock."""
+        self._timer = threading.Timer(delay, func)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
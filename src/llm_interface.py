@@ -1,7 +1,34 @@
-from typing import List
+from typing import Callable, List, Optional, Tuple
+from time import monotonic, sleep
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+import asyncio
+from functools import partial
+import json
+import random
+import re
 import requests
+import threading
 import os
 from dotenv import load_dotenv
+from .endpoint_pool import Endpoint, EndpointPool
+from .response_cache import ResponseCache
+
+# Responses worth retrying: rate limiting and transient server trouble
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Replies suggesting the small model could not handle a request
+LOW_CONFIDENCE = re.compile(
+    r"\b(?:i'?m not sure|i don'?t know|i'?m unable|unable to determine|i cannot|i can'?t|not enough information)\b",
+    re.IGNORECASE
+)
+
+def is_confident(response: str) -> bool:
+    """Whether a small-tier reply can be used as it is."""
+    return bool(response.strip()) and not LOW_CONFIDENCE.search(response)
 
 class LLMInterface:
     def __init__(self):
@@ -13,51 +40,419 @@ class LLMInterface:
         if self.api_type == 'openrouter':
             self.api_key = os.getenv('OPENROUTER_API_KEY')
             self.api_url = "https://openrouter.ai/api/v1/chat/completions"
+            self.api_urls = [self.api_url]
             self.headers = {
                 "Authorization": f"Bearer {self.api_key}",
                 "HTTP-Referer": "http://localhost:8000",
                 "Content-Type": "application/json"
             }
-            self.model = "anthropic/claude-3.5-sonnet"
+            # Model tiers: 'small' for short background and classification calls,
+            # 'large' for answering the user
+            self.model = os.getenv('LLM_MODEL', "anthropic/claude-3.5-sonnet")
+            small_model = os.getenv('LLM_SMALL_MODEL', "anthropic/claude-3-haiku")
         else:  # local API
             self.api_key = os.getenv('LOCAL_API_KEY')
             self.api_url = os.getenv('LOCAL_API_URL', 'http://localhost:1234/v1/chat/completions')
+            # Replicas serving the same model; requests are spread across them
+            self.api_urls = [url.strip() for url in os.getenv('LOCAL_API_URLS', self.api_url).split(',') if url.strip()]
             self.headers = {
                 "Authorization": f"Bearer {self.api_key}",
                 "Content-Type": "application/json"
             }
             self.model = os.getenv('LOCAL_MODEL_NAME', 'local-model')
+            small_model = os.getenv('LOCAL_SMALL_MODEL_NAME', self.model)
+        self.models = {'small': small_model, 'large': self.model}
         
         if not self.api_key:
             raise ValueError(f"API key not found for {self.api_type}")
+
+        # Stream tokens as they are generated when the caller can display them
+        self.stream = os.getenv('LLM_STREAM', 'enabled') == 'enabled'
+        self.last_time_to_first_token: Optional[float] = None
+        self.last_generation_time: Optional[float] = None
+
+        # One pooled keep-alive session for every call instead of a new connection each turn
+        self.connect_timeout = float(os.getenv('LLM_CONNECT_TIMEOUT', '5'))
+        self.read_timeout = float(os.getenv('LLM_READ_TIMEOUT', '120'))
+        self.max_retries = int(os.getenv('LLM_MAX_RETRIES', '3'))
+        self.backoff_base = 0.5  # seconds before the first retry
+        self.backoff_max = 30.0
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=len(self.api_urls), pool_maxsize=8)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # Least-outstanding-requests balancing with circuit breaking over the endpoints
+        self.endpoints = EndpointPool(self.api_urls, cooldown=float(os.getenv('LLM_CIRCUIT_COOLDOWN', '30')))
+        health_interval = float(os.getenv('LLM_HEALTH_INTERVAL', '30'))
+        if len(self.endpoints) > 1 and health_interval > 0:
+            self.endpoints.start_health_checks(self._probe, health_interval)
+
+        # Hedging: a request slower than this percentile of recent ones is also sent to another endpoint
+        self.hedge_percentile = None
+        self.hedged = 0
+        self._hedge_executor = None
+        if os.getenv('LLM_HEDGE', 'disabled') == 'enabled' and len(self.endpoints) > 1:
+            self.hedge_percentile = float(os.getenv('LLM_HEDGE_PERCENTILE', '95'))
+            self._hedge_executor = ThreadPoolExecutor(max_workers=2 * len(self.endpoints), thread_name_prefix="llm-hedge")
+
+        # Identical requests within the TTL are answered from a local cache
+        self.cache = None
+        if os.getenv('LLM_CACHE', 'enabled') == 'enabled':
+            self.cache = ResponseCache(
+                os.getenv('LLM_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_cache.sqlite3')),
+                ttl=float(os.getenv('LLM_CACHE_TTL', '300')),
+                max_entries=int(os.getenv('LLM_CACHE_SIZE', '1000'))
+            )
+
+    def close(self):
+        """Close pooled connections, health checks and the response cache."""
+        self.endpoints.close()
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """Seconds to wait before retry number attempt (0-based), honoring Retry-After."""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                try:
+                    delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+                    return min(max(delay, 0), self.backoff_max)
+                except (TypeError, ValueError):
+                    pass
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _probe(self, endpoint: Endpoint) -> bool:
+        """Active health check: whether the endpoint's server answers its model list."""
+        url = endpoint.url
+        if url.endswith('/chat/completions'):
+            url = url[:-len('/chat/completions')] + '/models'
+        response = self.session.get(url, timeout=(self.connect_timeout, self.connect_timeout))
+        response.close()
+        return response.status_code < 500
+
+    def _send(self, endpoint: Endpoint, data: dict, stream: bool) -> requests.Response:
+        """
+        One POST to an endpoint reserved from the pool, recording the outcome
+        for its health. If it raises, the endpoint is released.
+        """
+        started = monotonic()
+        try:
+            response = self.session.post(
+                endpoint.url,
+                json=data,
+                stream=stream,
+                timeout=(self.connect_timeout, self.read_timeout)
+            )
+        except requests.RequestException:
+            self.endpoints.record(endpoint, False)
+            self.endpoints.release(endpoint)
+            raise
+        # Streamed requests are timed to the start of the response
+        latency = monotonic() - started if response.status_code < 400 else None
+        self.endpoints.record(endpoint, response.status_code < 500, latency, "stream" if stream else "")
+        return response
+
+    def _discard(self, endpoint: Endpoint, future: Future):
+        """Drop the losing copy of a hedged request."""
+        if future.exception() is None:
+            future.result().close()
+            self.endpoints.release(endpoint)
+
+    def _send_hedged(self, data: dict, stream: bool) -> Tuple[Endpoint, requests.Response]:
+        """
+        Send the request to the least loaded endpoint. With hedging enabled,
+        if no response has come after the hedge percentile of recent latencies,
+        a copy goes to a second healthy endpoint and the first usable response
+        wins.
+        """
+        endpoint = self.endpoints.acquire()
+        delay = None
+        if self.hedge_percentile is not None:
+            delay = self.endpoints.hedge_delay(self.hedge_percentile, "stream" if stream else "")
+        if delay is None:
+            return endpoint, self._send(endpoint, data, stream)
+
+        sends = {self._hedge_executor.submit(self._send, endpoint, data, stream): endpoint}
+        done, _ = wait(sends, timeout=delay)
+        if not done:
+            second = self.endpoints.acquire(exclude=[endpoint], fallback=False)
+            if second is not None:
+                self.hedged += 1
+                if os.getenv("DEBUG") == "enabled":
+                    print(f"---\nDEBUG - no response from {endpoint.url} after {delay:.2f}s, hedging to {second.url}\n---")
+                sends[self._hedge_executor.submit(self._send, second, data, stream)] = second
+
+        finished = []
+        winner = None
+        pending = set(sends)
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            finished.extend(done)
+            winner = next((future for future in done if future.exception() is None
+                           and future.result().status_code not in RETRY_STATUSES), None)
+        if winner is None:
+            # Every copy failed; the last one is handled like an unhedged failure
+            winner = finished[-1]
+
+        for future in finished:
+            if future is not winner:
+                self._discard(sends[future], future)
+        for future in pending:
+            future.add_done_callback(partial(self._discard, sends[future]))
+        return sends[winner], winner.result()
+
+    @contextmanager
+    def _post(self, data: dict, stream: bool = False):
+        """
+        POST to the API over the pooled session, retrying connection errors,
+        timeouts and retryable statuses with jittered exponential backoff.
+        Used as a context manager: the endpoint counts the request as
+        outstanding until the block exits.
+        """
+        for attempt in range(self.max_retries + 1):
+            endpoint = response = None
+            try:
+                endpoint, response = self._send_hedged(data, stream)
+                if response.status_code not in RETRY_STATUSES:
+                    break
+                error = requests.HTTPError(f"{response.status_code} from {endpoint.url}", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+
+            if attempt == self.max_retries:
+                break
+
+            delay = self._retry_delay(attempt, response)
+            if response is not None:
+                response.close()
+                self.endpoints.release(endpoint)
+            if os.getenv("DEBUG") == "enabled":
+                print(f"---\nDEBUG - API retry {attempt + 1}/{self.max_retries} in {delay:.1f}s: {error}\n---")
+            sleep(delay)
+
+        if response is None:
+            raise error
+        try:
+            response.raise_for_status()
+            yield response
+        finally:
+            response.close()
+            self.endpoints.release(endpoint)
         
-    def _make_api_call(self, messages: List[dict]) -> str:
+    def _make_api_call(self, messages: List[dict], model: str, params: Optional[dict] = None) -> str:
         """Make API call with appropriate formatting for the selected API."""
         data = {
-            "model": self.model,
-            "messages": messages
+            "model": model,
+            "messages": messages,
+            **(params or {})
         }
         
         if os.getenv("DEBUG") == "enabled":
-            print(f"---\nDEBUG - API call:\n{messages}\n---\n")
+            print(f"---\nDEBUG - API call ({model}):\n{messages}\n---\n")
 
 
         try:
-            response = requests.post(self.api_url, headers=self.headers, json=data)
-            response.raise_for_status()
-            cleaned_response = response.json()['choices'][0]['message']['content'].strip()
+            started = monotonic()
+            with self._post(data) as response:
+                cleaned_response = response.json()['choices'][0]['message']['content'].strip()
+            self.last_time_to_first_token = self.last_generation_time = monotonic() - started
 
             if os.getenv("DEBUG") == "enabled":
-                print(f"---\nDEBUG - API response:\n{response.json()['choices'][0]['message']['content'].strip()}\n---")
+                print(f"---\nDEBUG - API response:\n{cleaned_response}\n---")
 
             return cleaned_response
         except Exception as e:
             print(f"API error: {e}")
             raise
         
-    def get_response(self, messages: list[dict]):
+    def get_tool_response(self, messages: List[dict], tools: List[dict], tool_choice: str = "auto",
+                          tier: str = "large") -> dict:
+        """
+        Make a non-streaming call that offers OpenAI-style function tools.
+        Returns the assistant message, which holds either content or tool_calls.
+        Errors are raised to the caller.
+        """
+        data = {
+            "model": self.models[tier],
+            "messages": messages,
+            "tools": tools,
+            "tool_choice": tool_choice
+        }
+
+        if os.getenv("DEBUG") == "enabled":
+            print(f"---\nDEBUG - API call with tools:\n{messages}\n---\n")
+
+        started = monotonic()
+        with self._post(data) as response:
+            message = response.json()['choices'][0]['message']
+        self.last_time_to_first_token = self.last_generation_time = monotonic() - started
+
+        if os.getenv("DEBUG") == "enabled":
+            print(f"---\nDEBUG - API response:\n{message}\n---")
+
+        return message
+
+    def _stream_api_call(self, messages: List[dict], on_token: Callable[[str], None], model: str,
+                         params: Optional[dict] = None) -> str:
+        """
+        Make a streaming API call using the OpenAI-compatible server-sent events protocol.
+        Each content token is passed to on_token as it arrives; the full text is returned.
+        """
+        data = {
+            "model": model,
+            "messages": messages,
+            **(params or {}),
+            "stream": True
+        }
+
+        if os.getenv("DEBUG") == "enabled":
+            print(f"---\nDEBUG - API call ({model}, streaming):\n{messages}\n---\n")
+
+        try:
+            started = monotonic()
+            self.last_time_to_first_token = None
+            tokens = []
+            with self._post(data, stream=True) as response:
+                response.encoding = 'utf-8'  # event streams often omit the charset
+                for line in response.iter_lines(decode_unicode=True):
+                    # Skip blank separators and ": keep-alive" comments
+                    if not line or not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+
+                    chunk = json.loads(payload)
+                    if 'error' in chunk:
+                        error = chunk['error']
+                        raise RuntimeError(error.get('message', error) if isinstance(error, dict) else error)
+                    choices = chunk.get('choices') or []
+                    token = choices[0].get('delta', {}).get('content') if choices else None
+                    if not token:
+                        continue
+
+                    if self.last_time_to_first_token is None:
+                        self.last_time_to_first_token = monotonic() - started
+                    tokens.append(token)
+                    on_token(token)
+
+            self.last_generation_time = monotonic() - started
+            cleaned_response = "".join(tokens).strip()
+
+            if os.getenv("DEBUG") == "enabled":
+                print(f"\n---\nDEBUG - API response streamed: first token after "
+                      f"{self.last_time_to_first_token or 0:.2f}s, done after {self.last_generation_time:.2f}s\n---")
+
+            return cleaned_response
+        except Exception as e:
+            print(f"API error: {e}")
+            raise
+
+    def _complete(self, messages: list[dict], on_token: Optional[Callable[[str], None]],
+                  use_cache: bool, tier: str, accept: Callable[[str], bool] = is_confident,
+                  params: Optional[dict] = None) -> str:
+        """get_response without the error handling: failures are raised."""
+        if tier == "cascade":
+            return self._cascade(messages, on_token, use_cache, accept, params)
+
+        model = self.models[tier]
+        key = None
+        if use_cache and self.cache is not None:
+            key = ResponseCache.make_key(model, messages, params)
+            cached = self.cache.get(key)
+            if cached is not None:
+                if os.getenv("DEBUG") == "enabled":
+                    print("---\nDEBUG - API response served from cache\n---")
+                self.last_time_to_first_token = self.last_generation_time = 0.0
+                if on_token is not None:
+                    on_token(cached)
+                return cached
+
+        if on_token is not None and self.stream:
+            response = self._stream_api_call(messages, on_token, model, params)
+        else:
+            response = self._make_api_call(messages, model, params)
+        if key is not None:
+            self.cache.put(key, response)
+        return response
+
+    def _cascade(self, messages: list[dict], on_token: Optional[Callable[[str], None]],
+                 use_cache: bool, accept: Callable[[str], bool], params: Optional[dict] = None) -> str:
+        """
+        Ask the small model first and escalate to the large one when its reply
+        fails, or accept rejects it. The small reply is not streamed, since it
+        may be discarded.
+        """
+        try:
+            response = self._complete(messages, None, use_cache, "small", params=params)
+            if accept(response):
+                if on_token is not None:
+                    on_token(response)
+                return response
+            reason = "low confidence"
+        except Exception as e:
+            reason = str(e)
+
+        if os.getenv("DEBUG") == "enabled":
+            print(f"---\nDEBUG - escalating to {self.models['large']}: {reason}\n---")
+        return self._complete(messages, on_token, use_cache, "large", params=params)
+
+    def get_response(self, messages: list[dict], on_token: Optional[Callable[[str], None]] = None,
+                     use_cache: bool = False, tier: str = "large", params: Optional[dict] = None):
+        """
+        Get a completion for the messages from the given model tier: 'large',
+        'small', or 'cascade' (small first, escalating to large when its reply
+        is not usable).
+        If on_token is given and streaming is enabled, tokens are passed to it as they arrive.
+        params (e.g. temperature, max_tokens) are added to the request body.
+        Set use_cache=True to answer a repeat of the same request from the response cache.
+        """
+        try:
+            return self._complete(messages, on_token, use_cache, tier, params=params)
+        except Exception as e:
+            print(f"API error: {e}")
+            return f"Sorry, I encountered an error: {str(e)}"
+
+    def get_cascade_response(self, messages: list[dict], on_token: Optional[Callable[[str], None]] = None,
+                             use_cache: bool = False, accept: Callable[[str], bool] = is_confident,
+                             params: Optional[dict] = None):
+        """get_response with the 'cascade' tier and a custom accept (default: is_confident)."""
         try:
-            return self._make_api_call(messages)
+            return self._complete(messages, on_token, use_cache, "cascade", accept, params)
         except Exception as e:
             print(f"API error: {e}")
             return f"Sorry, I encountered an error: {str(e)}"
+
+    async def get_response_async(self, messages: list[dict], on_token: Optional[Callable[[str], None]] = None,
+                                 use_cache: bool = False, tier: str = "large", params: Optional[dict] = None):
+        """
+        Async variant of get_response; the pooled request runs on a worker thread.
+        Cancelling it stops a streamed response at the next token.
+        """
+        cancelled = threading.Event()
+
+        def forward(token: str):
+            if cancelled.is_set():
+                # Not an Exception, so it passes the error handling and ends the stream
+                raise asyncio.CancelledError()
+            on_token(token)
+
+        try:
+            return await asyncio.to_thread(self.get_response, messages, on_token and forward, use_cache, tier, params)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def get_tool_response_async(self, messages: List[dict], tools: List[dict], tool_choice: str = "auto",
+                                      tier: str = "large") -> dict:
+        """Async variant of get_tool_response."""
+        return await asyncio.to_thread(self.get_tool_response, messages, tools, tool_choice, tier)
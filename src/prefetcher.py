@@ -0,0 +1,109 @@
+"""
+Background refresh of the data sources, so a query almost always finds
+their data already fetched.
+"""
+
+import asyncio
+import os
+from concurrent.futures import Executor
+from time import monotonic
+from typing import Callable, Dict, Iterable, Optional
+
+from .data_sources import DataSource
+
+class Prefetcher:
+    """
+    Refreshes each source on its own interval, starting at its cache TTL.
+    The interval halves when a refresh finds changed data and grows by half
+    when it finds none, within min_interval and max_interval seconds.
+    poke() refreshes anything older than min_interval right away.
+    """
+
+    def __init__(self, sources: Iterable[DataSource], executor: Executor,
+                 min_interval: float = 15.0, max_interval: float = 300.0,
+                 on_refresh: Optional[Callable[[DataSource, str], None]] = None):
+        self.executor = executor
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.on_refresh = on_refresh
+        # source -> {'interval', 'due' (monotonic), 'output' (last seen), 'running'}
+        self.states: Dict[DataSource, Dict] = {
+            source: {
+                'interval': min(max(source.cache_ttl, min_interval), max_interval),
+                'due': None,
+                'output': None,
+                'running': False
+            }
+            for source in sources
+        }
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def poke(self):
+        """
+        A turn is starting: refresh whatever is not recent. Sources never
+        fetched yet are left to the fetch already started for them.
+        """
+        now = monotonic()
+        for source, state in self.states.items():
+            age = source.cache_age()
+            if not state['running'] and age is not None and age > self.min_interval:
+                state['due'] = now
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _refresh(self, source: DataSource):
+        state = self.states[source]
+        loop = asyncio.get_running_loop()
+        changed = False
+        try:
+            _, output = await loop.run_in_executor(self.executor, source.refresh)
+            changed = state['output'] is not None and output != state['output']
+            state['output'] = output
+            if self.on_refresh is not None:
+                self.on_refresh(source, output)
+        except Exception as e:
+            print(f"Error prefetching {source.name}: {e}")
+        finally:
+            if changed:
+                state['interval'] = max(state['interval'] / 2, self.min_interval)
+            else:
+                state['interval'] = min(state['interval'] * 1.5, self.max_interval)
+            state['due'] = monotonic() + state['interval']
+            state['running'] = False
+            self._wakeup.set()
+
+        if os.getenv("DEBUG") == "enabled":
+            print(f"---\nDEBUG - prefetched {source.name} ({'changed' if changed else 'unchanged'}), "
+                  f"next in {state['interval']:.0f}s\n---\n")
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        tasks = set()
+        started = monotonic()
+        for state in self.states.values():
+            if state['due'] is None:
+                state['due'] = started + state['interval']
+
+        try:
+            while True:
+                now = monotonic()
+                for source, state in self.states.items():
+                    if not state['running'] and state['due'] <= now:
+                        state['running'] = True
+                        task = asyncio.create_task(self._refresh(source))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+
+                waiting = [state['due'] for state in self.states.values() if not state['running']]
+                timeout = max(min(waiting) - now, 0) if waiting else None
+                try:
+                    # Woken early by poke() or a finished refresh rescheduling its source
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Wait for the refreshes to stop before anyone shuts down what they use
+            await asyncio.gather(*tasks, return_exceptions=True)
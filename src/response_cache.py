@@ -0,0 +1,93 @@
+"""
+Persistent cache of LLM responses, so repeated requests cost no tokens.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+WHITESPACE = re.compile(r"\s+")
+
+def normalize_content(content: str) -> str:
+    # The time of day stays in: an answer about "now" is only valid for the minute it was given
+    return WHITESPACE.sub(" ", content).strip()
+
+class ResponseCache:
+    """
+    SQLite-backed response cache with TTL expiry and least-recently-used
+    eviction once it holds more than max_entries responses.
+    """
+
+    def __init__(self, path: str, ttl: float = 300.0, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def make_key(model: str, messages: list[dict], params: Optional[dict] = None) -> str:
+        """Canonical hash of everything that determines a response."""
+        canonical = json.dumps(
+            {
+                "model": model,
+                "messages": [
+                    {"role": message["role"], "content": normalize_content(message.get("content") or "")}
+                    for message in messages
+                ],
+                "params": params or {}
+            },
+            sort_keys=True,
+            separators=(",", ":")
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM responses WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            self._db.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,179 @@
+"""
+Local retrieval index over data-source records, so only the records relevant
+to a query need to go into the prompt.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOPWORDS = frozenset("""
+a an and are as at be by do does for from has have i in is it me my of on or
+so that the this to was what when where which who will with you your any there
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+def expand_query(query: str, now: Optional[datetime] = None) -> str:
+    """Spell out relative dates so they match the dates written into record text."""
+    now = now or datetime.now()
+    offsets = {"today": 0, "tonight": 0, "tomorrow": 1, "yesterday": -1}
+    words = set(tokenize(query))
+    extra = [
+        (now + timedelta(days=offset)).strftime("%A %B %d").replace(" 0", " ")
+        for word, offset in offsets.items() if word in words
+    ]
+    return " ".join([query] + extra)
+
+class RetrievalIndex:
+    """
+    BM25 inverted index of records from every source, saved to disk between runs.
+    An embed callable (text -> vector) can be given to add vector similarity
+    to the ranking.
+    """
+
+    def __init__(self, path: Optional[str] = None, embed: Optional[Callable[[str], List[float]]] = None,
+                 k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.embed = embed
+        self.k1 = k1
+        self.b = b
+        # "source/record id" -> {'fingerprint', 'length', 'terms': {term: count}, 'vector'}
+        self.documents: Dict[str, Dict] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}  # term -> {doc key: term count}
+        self.total_length = 0
+        self._dirty = False
+        if path:
+            self.load()
+
+    @staticmethod
+    def _key(source_name: str, record_id: str) -> str:
+        return f"{source_name}/{record_id}"
+
+    def _add(self, key: str, fingerprint: str, text: str):
+        terms = Counter(tokenize(text))
+        document = {'fingerprint': fingerprint, 'length': sum(terms.values()), 'terms': dict(terms)}
+        if self.embed is not None:
+            document['vector'] = self.embed(text)
+        self.documents[key] = document
+        self.total_length += document['length']
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[key] = count
+
+    def _remove(self, key: str):
+        document = self.documents.pop(key)
+        self.total_length -= document['length']
+        for term in document['terms']:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self.postings[term]
+
+    def sync_source(self, source_name: str, records: Dict[str, Tuple[str, str]]):
+        """
+        Make the index hold exactly the given records for one source.
+        records maps record id -> (fingerprint, text); unchanged records are not re-indexed.
+        """
+        prefix = source_name + "/"
+        wanted = {self._key(source_name, record_id): value for record_id, value in records.items()}
+
+        for key in [key for key in self.documents if key.startswith(prefix) and key not in wanted]:
+            self._remove(key)
+            self._dirty = True
+
+        for key, (fingerprint, text) in wanted.items():
+            existing = self.documents.get(key)
+            if existing is not None and existing['fingerprint'] == fingerprint:
+                continue
+            if existing is not None:
+                self._remove(key)
+            self._add(key, fingerprint, text)
+            self._dirty = True
+
+    def search(self, query: str, k: int = 10,
+               source_names: Optional[Set[str]] = None) -> List[Tuple[str, str, float]]:
+        """
+        The top k (source name, record id, score) matches for the query, best
+        first, optionally limited to the named sources.
+        """
+        if not self.documents:
+            return []
+
+        scores: Dict[str, float] = {}
+        count = len(self.documents)
+        average_length = self.total_length / count or 1
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, frequency in postings.items():
+                length = self.documents[key]['length']
+                norm = frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[key] = scores.get(key, 0.0) + idf * frequency * (self.k1 + 1) / norm
+
+        if self.embed is not None:
+            # Blend normalized BM25 with cosine similarity so either can surface a record
+            best = max(scores.values(), default=0.0) or 1.0
+            query_vector = self.embed(query)
+            for key, document in self.documents.items():
+                similarity = self._cosine(query_vector, document.get('vector'))
+                scores[key] = scores.get(key, 0.0) / best + similarity
+
+        if source_names is not None:
+            scores = {key: score for key, score in scores.items() if key.split("/", 1)[0] in source_names}
+
+        ranked = sorted(
+            (item for item in scores.items() if item[1] > 0),
+            key=lambda item: item[1],
+            reverse=True
+        )[:k]
+        return [(*key.split("/", 1), score) for key, score in ranked]
+
+    @staticmethod
+    def _cosine(a: List[float], b: Optional[List[float]]) -> float:
+        if not b:
+            return 0.0
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return dot / norm if norm else 0.0
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as index_file:
+                stored = json.load(index_file)
+        except (OSError, ValueError) as e:
+            print(f"Error loading retrieval index, starting empty: {e}")
+            return
+        for key, document in stored.get('documents', {}).items():
+            # Vectors from a different (or no) embedder are not comparable
+            if (self.embed is None) != ('vector' not in document):
+                continue
+            self.documents[key] = document
+            self.total_length += document['length']
+            for term, frequency in document['terms'].items():
+                self.postings.setdefault(term, {})[key] = frequency
+
+    def save(self):
+        """Write the index to disk if anything changed since the last save."""
+        if not self.path or not self._dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temporary_path = self.path + ".tmp"
+            with open(temporary_path, 'w', encoding='utf-8') as index_file:
+                json.dump({'documents': self.documents}, index_file)
+            os.replace(temporary_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            print(f"Error saving retrieval index: {e}")
@@ -0,0 +1,158 @@
+"""
+Query-aware source routing: a fast keyword and date-expression classifier
+that decides which data sources a message needs.
+"""
+
+import json
+import os
+import re
+from datetime import datetime
+from time import perf_counter
+from typing import Callable, Iterable, List, Optional
+
+from .data_sources import DataSource
+
+def _words(*words: str) -> re.Pattern:
+    return re.compile(r"\b(?:" + "|".join(words) + r")\b", re.IGNORECASE)
+
+# Evidence that a message is about one particular source, keyed by source name
+SOURCE_PATTERNS = {
+    "Gmail": _words(
+        r"e-?mails?", r"g?mail", r"inbox", r"unread", r"messages?", r"repl(?:y|ied|ies)",
+        r"wrote", r"sent", r"senders?", r"newsletters?", r"subject", r"cc'?d"
+    ),
+    "Calendar": _words(
+        r"calendars?", r"events?", r"meetings?", r"appointments?", r"schedule[ds]?",
+        r"agenda", r"busy", r"free", r"available", r"availability", r"booked", r"invites?",
+        r"calls?", r"plans?", r"conflicts?", r"where am i", r"when is", r"what time"
+    ),
+    "Tasks": _words(
+        r"tasks?", r"to-?dos?", r"to do", r"due", r"deadlines?", r"overdue", r"pending",
+        r"outstanding", r"finish(?:ed)?", r"complete[ds]?", r"done", r"chores?", r"reminders?",
+        r"assignments?", r"work on", r"backlog"
+    ),
+}
+
+# Dates and times point at the calendar and at due dates
+DATE_EXPRESSION = re.compile(
+    r"\b(?:today|tonight|tomorrow|yesterday|this (?:morning|afternoon|evening)"
+    r"|(?:this|next|last) (?:week|weekend|month)|weekend"
+    r"|mon(?:day)?|tue(?:s|sday)?|wed(?:nesday)?|thu(?:rs|rsday)?|fri(?:day)?|saturday|sunday"
+    r"|jan(?:uary)?|feb(?:ruary)?|march|apr(?:il)?|june?|july?|aug(?:ust)?"
+    r"|sep(?:t|tember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?"
+    r"|in \d+ (?:days?|weeks?|hours?)|\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?"
+    r"|\d{1,2}(?::\d{2})? ?(?:am|pm)|\d{1,2}:\d{2})\b",
+    re.IGNORECASE
+)
+
+# Requests for a general overview need everything
+OVERVIEW = _words(
+    r"briefing", r"overview", r"summary", r"summari[sz]e", r"catch me up", r"what did i miss",
+    r"anything new", r"what's new", r"whats new", r"what'?s up", r"what'?s going on", r"update me",
+    r"my day", r"my week"
+)
+
+# Messages made up entirely of pleasantries need no data at all
+SMALL_TALK = re.compile(
+    r"^(?:\s*(?:thanks?(?: you)?|thx|ty|cool|great|nice|awesome|perfect|got it|"
+    r"will do|hi|hello|hey|good (?:morning|night|evening)|"
+    r"bye|goodbye|see you|lol|haha|wow|that'?s all|never ?mind|you'?re welcome)\b[\s!.,:)]*)+$",
+    re.IGNORECASE
+)
+
+# Yes/no replies usually answer an offer from the previous turn
+# ("Want me to list your overdue tasks?"), so they need its sources
+REPLY = re.compile(
+    r"^(?:\s*(?:yes|yeah|yep|yup|no|nah|nope|ok(?:ay)?|k|sure|please|go ahead|do it|sounds good)"
+    r"\b[\s!.,:)]*)+$",
+    re.IGNORECASE
+)
+
+class RouteDecision:
+    def __init__(self, sources: List[DataSource], confidence: float, reason: str):
+        self.sources = sources
+        self.confidence = confidence
+        self.reason = reason
+
+class QueryRouter:
+    """
+    Chooses which data sources to consult for a query.
+    Anything the patterns are not confident about goes to the model
+    classifier, if one is given (query -> source names, or None if it
+    cannot tell), and otherwise falls back to every source.
+    Yes/no replies reuse the sources of the previous route.
+    """
+
+    def __init__(self, sources: Iterable[DataSource], min_confidence: float = 0.5,
+                 log_path: Optional[str] = None,
+                 classifier: Optional[Callable[[str], Optional[List[str]]]] = None):
+        self.sources = list(sources)
+        self.min_confidence = min_confidence
+        self.classifier = classifier
+        self.last_sources: Optional[List[DataSource]] = None
+        # Decisions are appended here as JSON lines so the patterns can be tuned
+        self.log_path = log_path if log_path is not None else os.getenv("ROUTER_LOG")
+
+    def _classify(self, query: str) -> RouteDecision:
+        if SMALL_TALK.match(query):
+            return RouteDecision([], 1.0, "small talk")
+        if REPLY.match(query) and self.last_sources is not None:
+            return RouteDecision(self.last_sources, 0.8, "reply to the previous turn")
+        if OVERVIEW.search(query):
+            return RouteDecision(self.sources, 1.0, "overview")
+
+        matched = [
+            source for source in self.sources
+            if source.name in SOURCE_PATTERNS and SOURCE_PATTERNS[source.name].search(query)
+        ]
+        if matched:
+            return RouteDecision(matched, 0.9, "keywords")
+
+        if DATE_EXPRESSION.search(query):
+            dated = [source for source in self.sources if source.name in ("Calendar", "Tasks")]
+            if dated:
+                return RouteDecision(dated, 0.7, "date expression")
+
+        return RouteDecision(self.sources, 0.0, "no match")
+
+    def route(self, query: str) -> List[DataSource]:
+        """The sources worth fetching for this query."""
+        started = perf_counter()
+        decision = self._classify(query)
+        if decision.confidence < self.min_confidence and self.classifier is not None:
+            names = self.classifier(query)
+            if names is not None:
+                decision = RouteDecision(
+                    [source for source in self.sources if source.name in names],
+                    self.min_confidence,
+                    "model"
+                )
+        if decision.confidence < self.min_confidence:
+            decision = RouteDecision(self.sources, decision.confidence, decision.reason + ", using all sources")
+        elapsed_us = (perf_counter() - started) * 1e6
+        self.last_sources = decision.sources
+
+        self._log(query, decision, elapsed_us)
+        return decision.sources
+
+    def _log(self, query: str, decision: RouteDecision, elapsed_us: float):
+        names = [source.name for source in decision.sources]
+        if os.getenv("DEBUG") == "enabled":
+            print(f"---\nDEBUG - routed to {names or 'no sources'} ({decision.reason}, "
+                  f"confidence {decision.confidence:.1f}, {elapsed_us:.0f}us)\n---\n")
+
+        if not self.log_path:
+            return
+        entry = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "query": query,
+            "sources": names,
+            "reason": decision.reason,
+            "confidence": decision.confidence,
+            "elapsed_us": round(elapsed_us, 1)
+        }
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as log:
+                log.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Error writing routing log: {e}")
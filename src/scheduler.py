@@ -0,0 +1,193 @@
+"""
+Scheduler for proactive triggers: a heap of next fire times, slept on
+until the earliest one is due, with the work itself run off the event loop.
+"""
+
+import asyncio
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Set
+
+class CronTrigger:
+    """
+    Fires on a five-field crontab schedule (minute hour day month weekday),
+    in local time. Fields accept *, lists, ranges and steps, e.g. "*/15 9-17 * * 1-5".
+    Weekdays run 0-6 from Sunday; as in cron, when both day and weekday are
+    restricted either one matching is enough.
+    """
+
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, self.RANGES)
+        ]
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for part in field.split(","):
+            part, _, step = part.partition("/")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(value) for value in part.split("-", 1))
+            else:
+                start = int(part)
+                end = high if step else start
+            if not low <= start <= end <= high:
+                raise ValueError(f"Cron field {field!r} is outside {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_fire(self, after: datetime) -> datetime:
+        """The first matching minute strictly after the given time."""
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never fires: {self.expression!r}")
+
+class IntervalTrigger:
+    """Fires every interval seconds, starting one interval after it is scheduled."""
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("Interval must be positive")
+        self.interval = timedelta(seconds=seconds)
+
+    def next_fire(self, after: datetime) -> datetime:
+        return after + self.interval
+
+class Job:
+    """
+    A scheduled callable.
+    misfire_grace_time: how late (seconds) a fire may still run; later ones are skipped.
+    coalesce: run a backlog of missed fires once rather than once per fire.
+    """
+
+    def __init__(self, name: str, trigger, func: Callable[[], None],
+                 misfire_grace_time: float = 60.0, coalesce: bool = True):
+        self.name = name
+        self.trigger = trigger
+        self.func = func
+        self.misfire_grace_time = timedelta(seconds=misfire_grace_time)
+        self.coalesce = coalesce
+        self.next_run: Optional[datetime] = None
+        self.running = False
+
+class Scheduler:
+    """
+    Keeps jobs in a heap ordered by next fire time and sleeps until the
+    earliest is due. Coroutine jobs run as tasks on the loop; plain
+    callables run one at a time on a worker thread, so a long LLM call
+    never blocks the event loop. A job is not started again while it is
+    still running.
+    """
+
+    def __init__(self, max_workers: int = 1):
+        self.max_workers = max_workers
+        self.executor: Optional[ThreadPoolExecutor] = None  # created for the first plain-callable job
+        self._heap: List = []
+        self._counter = itertools.count()  # tie-breaker for equal fire times
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def add_job(self, job: Job, now: Optional[datetime] = None):
+        job.next_run = job.trigger.next_fire(now or datetime.now())
+        heapq.heappush(self._heap, (job.next_run, next(self._counter), job))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _due_runs(self, job: Job, now: datetime) -> int:
+        """
+        How many times job should run now and where its next fire is;
+        moves job.next_run past now, skipping fires that are too late.
+        """
+        runs = 0
+        while job.next_run <= now:
+            if now - job.next_run <= job.misfire_grace_time:
+                runs += 1
+            job.next_run = job.trigger.next_fire(job.next_run)
+        return min(runs, 1) if job.coalesce else runs
+
+    async def _run_job(self, job: Job, runs: int):
+        job.running = True
+        loop = asyncio.get_running_loop()
+        try:
+            for _ in range(runs):
+                if asyncio.iscoroutinefunction(job.func):
+                    await job.func()
+                else:
+                    if self.executor is None:
+                        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="jarvis-trigger")
+                    await loop.run_in_executor(self.executor, job.func)
+        except Exception as e:
+            print(f"Error running scheduled job '{job.name}': {e}")
+        finally:
+            job.running = False
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        tasks = set()
+        try:
+            await self._loop(tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Jobs have stopped before anyone shuts down what they use
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _loop(self, tasks: set):
+        while True:
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            next_run = self._heap[0][0]
+            delay = (next_run - datetime.now()).total_seconds()
+            if delay > 0:
+                try:
+                    # Woken early if a sooner job is added
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    self._wakeup.clear()
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, job = heapq.heappop(self._heap)
+            runs = self._due_runs(job, datetime.now())
+            heapq.heappush(self._heap, (job.next_run, next(self._counter), job))
+            if runs and not job.running:
+                task = asyncio.create_task(self._run_job(job, runs))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
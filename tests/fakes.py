@@ -0,0 +1,82 @@
+from dataclasses import dataclass
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from src.data_sources import DataSource
+from src.data_sources.request_scheduler import RequestScheduler
+
+@dataclass
+class Item:
+    id: str
+    title: str
+    due: str = ''
+
+def items(count):
+    return [Item(str(number), f"item {number}") for number in range(count)]
+
+class FakeSource(DataSource):
+    """A data source serving a list of Items, optionally failing to fetch."""
+
+    name = "Fake"
+    cache_ttl = 0.0
+    max_staleness = 0.0  # every read fetches
+    notable_fields = ('due',)
+
+    def __init__(self, records):
+        super().__init__()
+        self.records = records
+        self.fail = False
+
+    def _fetch_data(self):
+        if self.fail:
+            raise ConnectionError("network down")
+        return list(self.records)
+
+    def _format_data(self, data):
+        return "".join(f"- {item.title}\n" for item in data) or "Nothing.\n"
+
+class FakeRequest:
+    """A Google API request that answers with respond() when executed."""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.headers = {}
+
+    def execute(self, http=None):
+        return self.respond()
+
+class FakeBatch:
+    """A batch HTTP request running each added request in turn."""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self, http=None):
+        for request_id, request in self.requests:
+            try:
+                response = request.execute()
+            except Exception as e:
+                self.callback(request_id, None, e)
+            else:
+                self.callback(request_id, response, None)
+
+def http_error(status):
+    return HttpError(httplib2.Response({'status': status}), b'{"error": {"message": "fake"}}')
+
+def with_service(source, service, monkeypatch):
+    """
+    Point a GoogleSource at a fake API client, bypassing credentials, behind
+    a fresh scheduler with no rate limits.
+    """
+    scheduler = RequestScheduler(backoff_base=0.0, backoff_max=0.0)
+    scheduler.buckets = {}
+    monkeypatch.setattr(RequestScheduler, "_shared", scheduler)
+    source._service = service
+    source._service_ready = True
+    monkeypatch.setattr(source, "_send", lambda request: request.execute())
+    return source
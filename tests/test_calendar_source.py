@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.data_sources import GoogleCalendarSource
+
+from .fakes import FakeRequest, http_error, with_service
+
+class FakeCalendar:
+    """
+    The parts of the Calendar API GoogleCalendarSource uses. events().list
+    answers each calendar with the pages queued for it in pages, and
+    records the parameters of every call.
+    """
+
+    def __init__(self, calendars):
+        self.calendars = calendars  # calendar id -> summary
+        self.pages = {}  # calendar id -> list of responses
+        self.errors = {}  # calendar id -> error raised by its next call
+        self.calls = []
+
+    def calendarList(self):
+        return FakeCalendarList(self)
+
+    def events(self):
+        return FakeEvents(self)
+
+class FakeCalendarList:
+    def __init__(self, calendar):
+        self.calendar = calendar
+
+    def list(self, pageToken, syncToken):
+        return FakeRequest(lambda: {
+            'items': [{'id': calendar_id, 'summary': summary} for calendar_id, summary in self.calendar.calendars.items()],
+            'nextSyncToken': 'calendars',
+        })
+
+class FakeEvents:
+    def __init__(self, calendar):
+        self.calendar = calendar
+
+    def list(self, pageToken, calendarId, **params):
+        def respond():
+            self.calendar.calls.append((calendarId, pageToken, params))
+            error = self.calendar.errors.pop(calendarId, None)
+            if error is not None:
+                raise error
+            return self.calendar.pages[calendarId].pop(0)
+        return FakeRequest(respond)
+
+def event(event_id, days=1, summary=None, status='confirmed'):
+    start = datetime.now(timezone.utc).replace(hour=12, minute=0, second=0, microsecond=0) + timedelta(days=days)
+    return {
+        'id': event_id,
+        'status': status,
+        'summary': summary or f"event {event_id}",
+        'start': {'dateTime': start.isoformat()},
+        'end': {'dateTime': (start + timedelta(hours=1)).isoformat()},
+    }
+
+def page(*events, sync_token='synced', next_page=None):
+    result = {'items': list(events)}
+    if next_page:
+        result['nextPageToken'] = next_page
+    else:
+        result['nextSyncToken'] = sync_token
+    return result
+
+@pytest.fixture
+def calendar():
+    return FakeCalendar({'primary': 'Personal', 'team': 'Team'})
+
+@pytest.fixture
+def source(calendar, monkeypatch):
+    return with_service(GoogleCalendarSource(), calendar, monkeypatch)
+
+def summaries(events):
+    return [event.summary for event in events]
+
+def test_events_shared_by_two_calendars_are_listed_once(source, calendar):
+    calendar.pages = {
+        'primary': [page(event('standup', days=1), event('lunch', days=2))],
+        'team': [page(event('standup', days=1), event('review', days=3))],
+    }
+
+    events = source._fetch_data()
+
+    assert summaries(events) == ['event standup', 'event lunch', 'event review']
+    assert [event.calendar for event in events] == ['Personal', 'Personal', 'Team']
+    assert len({source.record_id(event) for event in events}) == len(events)
+
+def test_later_fetches_apply_changes_since_the_sync_token(source, calendar):
+    calendar.pages = {
+        'primary': [page(event('a', days=1), event('b', days=2), sync_token='p1')],
+        'team': [page(sync_token='t1')],
+    }
+    source._fetch_data()
+
+    calendar.calls.clear()
+    calendar.pages = {
+        'primary': [page(event('a', days=1, summary='moved'), event('b', status='cancelled'), sync_token='p2')],
+        'team': [page(event('c', days=4), sync_token='t2')],
+    }
+
+    assert summaries(source._fetch_data()) == ['moved', 'event c']
+    assert {calendar_id: params.get('syncToken') for calendar_id, _, params in calendar.calls} == {
+        'primary': 'p1',
+        'team': 't1',
+    }
+    assert all('timeMin' not in params for _, _, params in calendar.calls)
+    assert source._calendars['primary']['sync_token'] == 'p2'
+
+def test_events_are_read_page_by_page(source, calendar):
+    calendar.pages = {
+        'primary': [page(event('a', days=1), next_page='next'), page(event('b', days=2))],
+        'team': [page()],
+    }
+
+    assert summaries(source._fetch_data()) == ['event a', 'event b']
+    assert [page_token for calendar_id, page_token, _ in calendar.calls if calendar_id == 'primary'] == [None, 'next']
+
+def test_expired_sync_token_falls_back_to_a_full_sync(source, calendar):
+    calendar.pages = {
+        'primary': [page(event('a', days=1), event('b', days=2), sync_token='p1')],
+        'team': [page(sync_token='t1')],
+    }
+    source._fetch_data()
+
+    calendar.calls.clear()
+    calendar.errors = {'primary': http_error(410)}
+    calendar.pages = {
+        'primary': [page(event('b', days=2), sync_token='p2')],
+        'team': [page(sync_token='t2')],
+    }
+
+    # Event a was deleted while the token was stale; the full sync drops it
+    assert summaries(source._fetch_data()) == ['event b']
+    primary_calls = [params for calendar_id, _, params in calendar.calls if calendar_id == 'primary']
+    assert primary_calls[0]['syncToken'] == 'p1'
+    assert 'syncToken' not in primary_calls[1] and 'timeMin' in primary_calls[1]
+    assert source._calendars['primary']['sync_token'] == 'p2'
+
+def test_other_errors_are_raised(source, calendar):
+    calendar.errors = {'primary': http_error(500)}
+    calendar.pages = {'primary': [], 'team': [page()]}
+
+    with pytest.raises(Exception):
+        source._fetch_data()
@@ -0,0 +1,43 @@
+from src.change_detector import ChangeDetector
+
+from .fakes import FakeSource, Item, items
+
+def test_first_check_records_baseline_only():
+    detector = ChangeDetector([FakeSource(items(3))])
+    assert detector.check() == {}
+
+def test_new_records_are_notable():
+    source = FakeSource(items(2))
+    detector = ChangeDetector([source])
+    detector.check()
+    source.records = items(3)
+    changes = detector.check()
+    assert [item.id for item in changes[source].added] == ['2']
+    assert "New in Fake" in detector.describe()
+
+def test_only_notable_field_edits_are_reported():
+    source = FakeSource(items(2))
+    detector = ChangeDetector([source])
+    detector.check()
+    source.records = [Item('0', "renamed"), Item('1', "item 1", due="2024-01-01")]
+    changes = detector.check()
+    assert [new.id for _, new in changes[source].modified] == ['1']
+
+def test_removals_are_not_notable():
+    source = FakeSource(items(3))
+    detector = ChangeDetector([source])
+    detector.check()
+    source.records = items(1)
+    assert detector.check() == {}
+
+def test_failed_fetch_keeps_baseline():
+    source = FakeSource(items(5))
+    detector = ChangeDetector([source])
+    detector.check()
+
+    source.fail = True
+    assert detector.check() == {}
+
+    source.fail = False
+    assert detector.check() == {}
+    assert len(detector.baselines[source]) == 5
@@ -0,0 +1,105 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from src.context_delta import ContextTracker, diff_snapshots, record_fingerprint, take_snapshot
+from src.core import Agent, Conversation
+
+from .fakes import FakeSource, Item, items
+
+def test_fingerprint_depends_on_content_only():
+    assert record_fingerprint(Item('1', "a")) == record_fingerprint(Item('1', "a"))
+    assert record_fingerprint(Item('1', "a")) != record_fingerprint(Item('1', "b"))
+
+def test_diff_snapshots():
+    source = FakeSource([])
+    previous = take_snapshot(source, [Item('1', "kept"), Item('2', "edited"), Item('3', "gone")])
+    current = take_snapshot(source, [Item('1', "kept"), Item('2', "edited!"), Item('4', "new")])
+    diff = diff_snapshots(previous, current)
+    assert [item.id for item in diff.added] == ['4']
+    assert [item.id for item in diff.removed] == ['3']
+    assert [(old.title, new.title) for old, new in diff.modified] == [("edited", "edited!")]
+
+def test_diff_of_equal_snapshots_is_empty():
+    source = FakeSource([])
+    assert not diff_snapshots(take_snapshot(source, items(3)), take_snapshot(source, items(3)))
+
+def test_tracker_renders_full_until_committed():
+    source = FakeSource([])
+    tracker = ContextTracker()
+    assert tracker.render(source, items(2), full=True)[0] == "- item 0\n- item 1\n"
+    text, snapshot = tracker.render(source, items(2), full=False)
+    assert text == "Fake (current data, not changes):\n- item 0\n- item 1\n"
+
+    tracker.commit({source: snapshot})
+    assert tracker.render(source, items(2), full=False)[0] == ""
+
+    text, _ = tracker.render(source, items(3), full=False)
+    assert text.startswith("Fake changes since the last update (1 new, 0 changed, 0 removed)")
+    assert "- item 2" in text
+
+def test_replace_forgets_sources_missing_from_a_full_snapshot():
+    first, second = FakeSource([]), FakeSource([])
+    tracker = ContextTracker()
+    tracker.commit({first: {}, second: {}})
+    tracker.commit({first: {}}, replace=True)
+    assert list(tracker.seen) == [first]
+
+def make_agent(sources):
+    agent = Agent.__new__(Agent)
+    agent.data_sources = sources
+    agent.pending_fetches = {}
+    agent.fetch_executor = ThreadPoolExecutor(max_workers=2)
+    agent.last_outputs = {}
+    agent.context_tracker = ContextTracker()
+    agent.retrieval_index = None
+    agent.conversation = Conversation("system")
+    agent.snapshot_message = None
+    return agent
+
+def test_failed_fetch_leaves_delta_state_alone():
+    source = FakeSource(items(30))
+    agent = make_agent([source])
+
+    context, snapshots = asyncio.run(agent.build_context(full=True))
+    agent.context_tracker.commit(snapshots, replace=True)
+    assert "- item 29" in context
+
+    source.fail = True
+    context, snapshots = asyncio.run(agent.build_context(full=False))
+    agent.context_tracker.commit(snapshots)
+    assert "Fake: unavailable (network down)" in context
+    assert "removed" not in context
+    assert len(agent.context_tracker.seen[source]) == 30
+
+    source.fail = False
+    context, _ = asyncio.run(agent.build_context(full=False))
+    assert "No changes since the last update: Fake." in context
+    agent.fetch_executor.shutdown()
+
+def test_only_a_render_of_every_source_becomes_the_snapshot():
+    calendar, tasks = FakeSource(items(2)), FakeSource(items(3))
+    agent = make_agent([calendar, tasks])
+
+    context, snapshots = asyncio.run(agent.build_context(full=True, sources=[]))
+    agent._store_turn("hi", "Hello!", context, snapshots, full=True)
+    assert agent.snapshot_message is None
+
+    context, snapshots = asyncio.run(agent.build_context(full=True, sources=[calendar]))
+    agent._store_turn("anything today?", "No.", context, snapshots, full=True)
+    assert agent.snapshot_message is None
+    assert list(agent.context_tracker.seen) == [calendar]
+
+    context, snapshots = asyncio.run(agent.build_context(full=True))
+    agent._store_turn("what's new?", "Nothing.", context, snapshots, full=True)
+    assert agent.snapshot_message is agent.conversation.messages[-2]
+    assert agent._snapshot_in_history("next")
+    agent.fetch_executor.shutdown()
+
+def test_a_failed_source_keeps_the_render_from_being_the_snapshot():
+    calendar, tasks = FakeSource(items(2)), FakeSource(items(3))
+    tasks.fail = True
+    agent = make_agent([calendar, tasks])
+    context, snapshots = asyncio.run(agent.build_context(full=True))
+    agent._store_turn("what's new?", "Nothing.", context, snapshots, full=True)
+    assert agent.snapshot_message is None
+    agent.fetch_executor.shutdown()
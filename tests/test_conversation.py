@@ -0,0 +1,47 @@
+from src.core import Conversation
+
+def words(count):
+    return " ".join(["word"] * count)
+
+def test_attached_context_counts_against_the_budget():
+    conversation = Conversation("system", max_history_tokens=100, tokenizer=lambda text: len(text.split()))
+    assert conversation.count_tokens({"role": "user", "content": words(5), "context": words(10) + "\n"}) == 19
+
+def test_snapshot_rolls_out_of_history():
+    conversation = Conversation("system", max_history_tokens=100, tokenizer=lambda text: len(text.split()))
+    snapshot = conversation.add_interaction("user", "hi", context=words(60) + "\n")
+    conversation.add_interaction("assistant", "hello")
+    assert any(message is snapshot for message in conversation.history_for("next"))
+
+    conversation.add_interaction("user", words(20))
+    conversation.add_interaction("assistant", words(20))
+    assert not any(message is snapshot for message in conversation.history_for("next"))
+
+def test_history_starts_with_a_user_message():
+    conversation = Conversation("system", max_history_tokens=30, tokenizer=lambda text: len(text.split()))
+    conversation.add_interaction("user", words(10))
+    conversation.add_interaction("assistant", words(10))
+    conversation.add_interaction("user", "again")
+    assert [message["role"] for message in conversation.messages] == ["user"]
+
+def test_context_that_does_not_fit_is_dropped_but_the_turn_kept():
+    conversation = Conversation("system", max_history_tokens=100, tokenizer=lambda text: len(text.split()))
+    snapshot = conversation.add_interaction("user", "what's new?", context=words(150) + "\n")
+    conversation.add_interaction("assistant", "Not much.")
+    assert [(message["role"], message["content"]) for message in conversation.messages] == [
+        ("user", "what's new?"), ("assistant", "Not much.")
+    ]
+    assert "context" not in conversation.messages[0]
+    # The snapshot is gone, so the next turn sends the data in full again
+    assert not any(message is snapshot for message in conversation.history_for("next"))
+
+def test_older_context_is_dropped_with_the_newer():
+    conversation = Conversation("system", max_history_tokens=100, tokenizer=lambda text: len(text.split()))
+    messages = [
+        {"role": "user", "content": "first", "context": words(5) + "\n"},
+        {"role": "assistant", "content": "ok"},
+        {"role": "user", "content": "second", "context": words(90) + "\n"},
+        {"role": "assistant", "content": words(10)}
+    ]
+    # The first context would fit, but not the delta after it
+    assert [message.get("context") for message in conversation._fit(messages, 100)] == [None, None, None, None]
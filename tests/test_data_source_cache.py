@@ -0,0 +1,104 @@
+import time
+
+import pytest
+
+import src.data_sources.data_source as data_source
+
+from .fakes import FakeSource, items
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(data_source, "monotonic", clock)
+    return clock
+
+class CountingSource(FakeSource):
+    cache_ttl = 30.0
+    max_staleness = 300.0
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.fetches = 0
+
+    def _fetch_data(self):
+        self.fetches += 1
+        return super()._fetch_data()
+
+def wait_for_refresh(source):
+    for _ in range(200):
+        with source._cache_lock:
+            if not source._refreshing:
+                return
+        time.sleep(0.01)
+    raise AssertionError("background refresh did not finish")
+
+def test_fresh_entries_are_served_from_cache(clock):
+    source = CountingSource(items(2))
+    assert source.get_data() == "- item 0\n- item 1\n"
+    clock.now += 29
+    source.get_data()
+    assert source.fetches == 1
+    assert source.cache_stats() == {'hits': 1, 'stale_hits': 0, 'misses': 1}
+
+def test_stale_entries_are_served_while_refreshing(clock):
+    source = CountingSource(items(2))
+    source.get_data()
+    source.records = items(3)
+    clock.now += 60
+
+    assert source.get_records() == items(2)  # the old data, straight away
+    wait_for_refresh(source)
+    assert source.fetches == 2
+    assert source.get_records() == items(3)
+    assert source.cache_stats() == {'hits': 1, 'stale_hits': 1, 'misses': 1}
+
+def test_expired_entries_are_fetched_before_returning(clock):
+    source = CountingSource(items(2))
+    source.get_data()
+    source.records = items(3)
+    clock.now += 30 + 301
+    assert source.get_records() == items(3)
+    assert source.cache_stats() == {'hits': 0, 'stale_hits': 0, 'misses': 2}
+
+def test_failed_background_refresh_keeps_the_last_good_entry(clock):
+    source = CountingSource(items(2))
+    source.get_data()
+    source.fail = True
+    clock.now += 60
+
+    assert source.get_records() == items(2)
+    wait_for_refresh(source)
+    assert source.fetches == 2
+    assert source.get_records() == items(2)
+    assert source.cache_age() == 60
+
+def test_failed_fetch_of_an_expired_entry_raises_and_keeps_it(clock):
+    source = CountingSource(items(2))
+    source.get_data()
+    source.fail = True
+    clock.now += 400
+    with pytest.raises(ConnectionError):
+        source.get_records()
+    assert source.cache_age() == 400  # the old entry is still cached
+
+def test_invalidate_forces_a_fetch(clock):
+    source = CountingSource(items(2))
+    source.get_data()
+    source.invalidate()
+    assert source.cache_age() is None
+    source.get_data()
+    assert source.fetches == 2
+
+def test_store_follows_the_cache(clock):
+    source = CountingSource(items(2))
+    assert list(source.get_store()) == items(2)
+    source.records = items(3)
+    source.refresh()
+    assert list(source.get_store()) == items(3)
@@ -0,0 +1,173 @@
+import pytest
+
+from src.data_sources import GmailSource
+
+from .fakes import FakeBatch, FakeRequest, http_error, with_service
+
+class FakeGmail:
+    """
+    The parts of the Gmail API GmailSource uses. The unread inbox is a list
+    of message IDs, newest first; history().list answers with the pages
+    queued in history_pages, or raises history_error.
+    """
+
+    def __init__(self, unread):
+        self.unread = list(unread)
+        self.history_id = '100'
+        self.history_pages = []
+        self.history_error = None
+        self.calls = []
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return FakeMessages(self)
+
+    def history(self):
+        return FakeHistory(self)
+
+    def getProfile(self, userId):
+        return FakeRequest(lambda: {'historyId': self.history_id})
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(callback)
+
+class FakeMessages:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, userId, maxResults, q):
+        def respond():
+            self.gmail.calls.append('list')
+            results = {'messages': [{'id': msg_id} for msg_id in self.gmail.unread[:maxResults]]}
+            if len(self.gmail.unread) > maxResults:
+                results['nextPageToken'] = 'more'
+            return results
+        return FakeRequest(respond)
+
+    def get(self, userId, id, format, metadataHeaders):
+        def respond():
+            self.gmail.calls.append(('get', id))
+            # Higher IDs are newer
+            return {
+                'id': id,
+                'snippet': f"snippet {id}",
+                'payload': {'headers': [
+                    {'name': 'From', 'value': 'sender@example.com'},
+                    {'name': 'Subject', 'value': f"subject {id}"},
+                    {'name': 'Date', 'value': f"Mon, 1 Jan 2024 10:{int(id):02d}:00 +0000"},
+                ]},
+            }
+        return FakeRequest(respond)
+
+class FakeHistory:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, userId, startHistoryId, pageToken):
+        def respond():
+            self.gmail.calls.append(('history', startHistoryId, pageToken))
+            if self.gmail.history_error is not None:
+                raise self.gmail.history_error
+            return self.gmail.history_pages.pop(0)
+        return FakeRequest(respond)
+
+def message(msg_id, *labels):
+    return {'message': {'id': msg_id, 'labelIds': list(labels)}}
+
+@pytest.fixture
+def gmail():
+    return FakeGmail(['3', '2', '1'])
+
+@pytest.fixture
+def source(gmail, monkeypatch):
+    return with_service(GmailSource(), gmail, monkeypatch)
+
+def ids(emails):
+    return [email.id for email in emails]
+
+def test_first_fetch_lists_the_unread_inbox(source, gmail):
+    assert ids(source._fetch_data()) == ['3', '2', '1']
+    assert gmail.calls.count('list') == 1
+    assert source._history_id == '100'
+
+def test_later_fetches_apply_history_instead_of_listing(source, gmail):
+    source._fetch_data()
+    gmail.calls.clear()
+    gmail.history_pages = [{
+        'history': [
+            {'messagesAdded': [message('4', 'INBOX', 'UNREAD')]},
+            {'labelsRemoved': [message('3', 'INBOX')]},  # read
+            {'labelsAdded': [message('2', 'INBOX', 'UNREAD', 'STARRED')]},
+            {'labelsRemoved': [message('1', 'UNREAD')]},  # archived
+        ],
+        'historyId': '105',
+    }]
+
+    assert ids(source._fetch_data()) == ['4', '2']
+    assert 'list' not in gmail.calls
+    # Only the new message is fetched; the rest come from the cache
+    assert [call for call in gmail.calls if call[0] == 'get'] == [('get', '4')]
+    assert source._history_id == '105'
+
+def test_deleted_messages_leave_the_inbox(source, gmail):
+    source._fetch_data()
+    gmail.history_pages = [{'history': [{'messagesDeleted': [message('2')]}], 'historyId': '101'}]
+
+    assert ids(source._fetch_data()) == ['3', '1']
+
+def test_history_is_read_page_by_page(source, gmail):
+    source._fetch_data()
+    gmail.calls.clear()
+    gmail.history_pages = [
+        {'history': [{'messagesAdded': [message('4', 'INBOX', 'UNREAD')]}], 'nextPageToken': 'page2'},
+        {'history': [{'messagesDeleted': [message('3')]}], 'historyId': '110'},
+    ]
+
+    assert ids(source._fetch_data()) == ['4', '2', '1']
+    assert [call for call in gmail.calls if call[0] == 'history'] == [
+        ('history', '100', None),
+        ('history', '100', 'page2'),
+    ]
+    assert source._history_id == '110'
+
+def test_expired_history_falls_back_to_a_full_sync(source, gmail):
+    source._fetch_data()
+    gmail.calls.clear()
+    gmail.history_error = http_error(404)
+    gmail.unread = ['5', '1']
+    gmail.history_id = '200'
+
+    assert ids(source._fetch_data()) == ['5', '1']
+    assert gmail.calls.count('list') == 1
+    assert source._history_id == '200'
+
+def test_other_history_errors_are_raised(source, gmail):
+    source._fetch_data()
+    gmail.history_error = http_error(400)
+
+    with pytest.raises(Exception):
+        source._fetch_data()
+
+def test_truncated_inbox_is_relisted_once_it_drops_below_the_limit(source, gmail):
+    source.max_emails = 2
+    assert ids(source._fetch_data()) == ['3', '2']
+    assert source._unread_truncated
+
+    # Reading a message leaves room for the older unread one never listed
+    gmail.calls.clear()
+    gmail.unread = ['2', '1']
+    gmail.history_pages = [{'history': [{'labelsRemoved': [message('3', 'INBOX')]}], 'historyId': '101'}]
+
+    assert ids(source._fetch_data()) == ['2', '1']
+    assert gmail.calls.count('list') == 1
+    assert not source._unread_truncated
+
+def test_untruncated_inbox_is_not_relisted(source, gmail):
+    source._fetch_data()
+    gmail.calls.clear()
+    gmail.history_pages = [{'history': [{'messagesDeleted': [message('3')]}], 'historyId': '101'}]
+
+    source._fetch_data()
+    assert 'list' not in gmail.calls
@@ -0,0 +1,108 @@
+import pytest
+
+from src.endpoint_pool import EndpointPool
+
+def make_pool(count=2, **kwargs):
+    return EndpointPool([f"http://replica-{number}" for number in range(count)], **kwargs)
+
+def fail(pool, endpoint, times):
+    for _ in range(times):
+        pool.record(endpoint, False)
+
+def test_needs_an_endpoint():
+    with pytest.raises(ValueError):
+        EndpointPool([])
+
+def test_least_outstanding_requests_win():
+    pool = make_pool(3)
+    first = pool.acquire()
+    second = pool.acquire()
+    third = pool.acquire()
+    assert {first, second, third} == set(pool.endpoints)
+
+    pool.release(second)
+    assert pool.acquire() is second
+
+def test_circuit_opens_after_consecutive_failures():
+    pool = make_pool(failure_threshold=3)
+    broken, healthy = pool.endpoints
+    fail(pool, broken, 2)
+    pool.record(broken, True)
+    fail(pool, broken, 2)
+    assert broken.opened_at is None
+
+    fail(pool, broken, 1)
+    assert broken.opened_at is not None
+    assert all(pool.acquire() is healthy for _ in range(5))
+
+def test_half_open_circuit_lets_one_trial_through():
+    pool = make_pool(cooldown=30.0)
+    broken, healthy = pool.endpoints
+    fail(pool, broken, 3)
+    broken.opened_at -= 31  # the cooldown has passed
+
+    healthy.outstanding = 10
+    assert pool.acquire() is broken
+    assert broken.trial
+    assert pool.acquire() is healthy  # only one trial at a time
+
+def test_successful_trial_closes_the_circuit():
+    pool = make_pool()
+    broken, _ = pool.endpoints
+    fail(pool, broken, 3)
+    broken.opened_at -= 31
+    pool.acquire(exclude=[pool.endpoints[1]])
+    pool.record(broken, True)
+    assert broken.opened_at is None and broken.failures == 0 and not broken.trial
+
+def test_failed_trial_waits_out_another_cooldown():
+    pool = make_pool()
+    broken, healthy = pool.endpoints
+    fail(pool, broken, 3)
+    broken.opened_at -= 31
+    pool.acquire(exclude=[healthy])
+    pool.record(broken, False)
+    assert not broken.trial
+    assert pool.acquire(exclude=[healthy], fallback=False) is None
+
+def test_open_circuits_are_tried_when_nothing_else_is_left():
+    pool = make_pool()
+    first, second = pool.endpoints
+    fail(pool, second, 3)
+    fail(pool, first, 3)
+    assert pool.acquire() is second  # open the longest
+    assert pool.acquire(fallback=False) is None
+
+def test_exclude():
+    pool = make_pool()
+    first, second = pool.endpoints
+    assert pool.acquire(exclude=[first]) is second
+    assert pool.acquire(exclude=[first, second]) is None
+
+def test_hedge_delay_needs_enough_samples():
+    pool = make_pool(min_samples=10)
+    endpoint = pool.endpoints[0]
+    for latency in range(1, 10):
+        pool.record(endpoint, True, float(latency))
+    assert pool.hedge_delay(90) is None
+
+    pool.record(endpoint, True, 10.0)
+    assert pool.hedge_delay(90) == 10.0
+    assert pool.hedge_delay(50) == 6.0
+    assert pool.hedge_delay(50, "stream") is None  # kinds are kept apart
+
+def test_health_check_opens_and_closes_circuits():
+    pool = make_pool()
+    first, second = pool.endpoints
+    pool.check(lambda endpoint: endpoint is first)
+    assert first.opened_at is None
+    assert second.opened_at is not None
+
+    def probe(endpoint):
+        if endpoint is first:
+            raise ConnectionError("unreachable")
+        return True
+
+    pool.check(probe)
+    assert first.opened_at is not None
+    assert second.opened_at is None
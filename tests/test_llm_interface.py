@@ -0,0 +1,250 @@
+import json
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+import requests
+
+import src.llm_interface as llm_interface
+from src.llm_interface import LLMInterface, is_confident
+from src.response_cache import ResponseCache
+
+@pytest.fixture
+def llm(monkeypatch):
+    monkeypatch.setenv("LLM_API_TYPE", "openrouter")
+    monkeypatch.setenv("OPENROUTER_API_KEY", "key")
+    monkeypatch.setenv("LLM_CACHE", "disabled")
+    monkeypatch.setenv("LLM_SMALL_MODEL", "small-model")
+    monkeypatch.setenv("LLM_MODEL", "large-model")
+    llm = LLMInterface()
+    yield llm
+    llm.close()
+
+def answer_with(llm, replies):
+    calls = []
+
+    def call(messages, model, params=None):
+        calls.append(model)
+        reply = replies[model]
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    llm._make_api_call = call
+    return calls
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+def test_is_confident():
+    assert is_confident("Your next meeting is at 3pm.")
+    assert not is_confident("I'm not sure what you mean.")
+    assert not is_confident("  ")
+
+def test_cascade_keeps_a_confident_small_reply(llm):
+    calls = answer_with(llm, {"small-model": "Fine.", "large-model": "Large."})
+    assert llm.get_response(MESSAGES, tier="cascade") == "Fine."
+    assert calls == ["small-model"]
+
+def test_cascade_escalates_hedged_replies(llm):
+    calls = answer_with(llm, {"small-model": "I don't know.", "large-model": "Large."})
+    assert llm.get_response(MESSAGES, tier="cascade") == "Large."
+    assert calls == ["small-model", "large-model"]
+
+def test_cascade_escalates_errors(llm):
+    answer_with(llm, {"small-model": RuntimeError("down"), "large-model": "Large."})
+    assert llm.get_cascade_response(MESSAGES) == "Large."
+
+def test_cascade_with_custom_accept(llm):
+    answer_with(llm, {"small-model": "Calendar", "large-model": "Tasks"})
+    assert llm.get_cascade_response(MESSAGES, accept=lambda reply: reply == "Tasks") == "Tasks"
+
+class FakeResponse:
+    """A requests.Response stand-in: a status, headers and a body of lines."""
+
+    def __init__(self, status_code=200, lines=(), body=None, headers=None):
+        self.status_code = status_code
+        self.lines = list(lines)
+        self.body = body
+        self.headers = headers or {}
+        self.encoding = None
+        self.closed = False
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}", response=self)
+
+    def close(self):
+        self.closed = True
+
+def respond_with(llm, monkeypatch, *responses):
+    """Answer successive session.post calls with responses (exceptions are raised)."""
+    queue = list(responses)
+    posts = []
+
+    def post(url, json, stream, timeout):
+        posts.append(json)
+        response = queue.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(llm.session, "post", post)
+    return posts
+
+def event(content=None, **chunk):
+    if content is not None:
+        chunk['choices'] = [{'delta': {'content': content}}]
+    return "data: " + json.dumps(chunk)
+
+def stream(llm, monkeypatch, *lines):
+    respond_with(llm, monkeypatch, FakeResponse(lines=lines))
+    tokens = []
+    return llm._stream_api_call(MESSAGES, tokens.append, "large-model"), tokens
+
+def test_stream_skips_keep_alives_and_blank_lines(llm, monkeypatch):
+    reply, tokens = stream(
+        llm, monkeypatch,
+        ": keep-alive", "", event("Hel"), "", ": OPENROUTER PROCESSING", event("lo"), "data: [DONE]"
+    )
+    assert reply == "Hello"
+    assert tokens == ["Hel", "lo"]
+
+def test_stream_stops_at_done(llm, monkeypatch):
+    reply, tokens = stream(llm, monkeypatch, event("Hi"), "data: [DONE]", event("ignored"))
+    assert reply == "Hi"
+    assert tokens == ["Hi"]
+
+def test_stream_skips_chunks_without_content(llm, monkeypatch):
+    reply, tokens = stream(
+        llm, monkeypatch,
+        "data: " + json.dumps({'choices': [{'delta': {'role': 'assistant'}}]}),
+        event(choices=[]),
+        event("Hi"),
+        event(""),
+        "data: [DONE]"
+    )
+    assert reply == "Hi"
+    assert tokens == ["Hi"]
+    assert llm.last_time_to_first_token is not None
+
+def test_stream_without_done_returns_what_arrived(llm, monkeypatch):
+    reply, tokens = stream(llm, monkeypatch, event("Part"), event("ial "))
+    assert reply == "Partial"
+    assert tokens == ["Part", "ial "]
+
+def test_stream_error_chunk_raises(llm, monkeypatch):
+    respond_with(llm, monkeypatch, FakeResponse(lines=[
+        event("Hel"), event(error={'message': 'overloaded', 'code': 502}), event("lo"), "data: [DONE]"
+    ]))
+    tokens = []
+    with pytest.raises(RuntimeError, match="overloaded"):
+        llm._stream_api_call(MESSAGES, tokens.append, "large-model")
+    assert tokens == ["Hel"]
+    # The response went back to the pool even though the stream failed
+    assert all(endpoint.outstanding == 0 for endpoint in llm.endpoints.endpoints)
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(llm_interface, "sleep", delays.append)
+    # Full jitter always picks its upper bound
+    monkeypatch.setattr(llm_interface.random, "uniform", lambda low, high: high)
+    return delays
+
+def ok():
+    return FakeResponse(body={'choices': [{'message': {'content': ' Done. '}}]})
+
+def test_post_retries_retryable_statuses_with_backoff(llm, monkeypatch, sleeps):
+    posts = respond_with(llm, monkeypatch, FakeResponse(503), FakeResponse(502), FakeResponse(429), ok())
+    assert llm._make_api_call(MESSAGES, "large-model") == "Done."
+    assert len(posts) == 4
+    assert sleeps == [0.5, 1.0, 2.0]
+
+def test_post_retries_connection_errors_and_timeouts(llm, monkeypatch, sleeps):
+    posts = respond_with(llm, monkeypatch, requests.ConnectionError("reset"), requests.Timeout("slow"), ok())
+    assert llm._make_api_call(MESSAGES, "large-model") == "Done."
+    assert len(posts) == 3
+    assert sleeps == [0.5, 1.0]
+
+def test_post_backoff_is_capped(llm, monkeypatch, sleeps):
+    llm.max_retries = 8
+    respond_with(llm, monkeypatch, *[FakeResponse(503)] * 8, ok())
+    llm._make_api_call(MESSAGES, "large-model")
+    assert sleeps == [0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 30.0, 30.0]
+
+def test_post_honors_retry_after_seconds(llm, monkeypatch, sleeps):
+    respond_with(llm, monkeypatch, FakeResponse(429, headers={'Retry-After': '7'}), ok())
+    llm._make_api_call(MESSAGES, "large-model")
+    assert sleeps == [7.0]
+
+def test_post_honors_retry_after_date(llm, monkeypatch, sleeps):
+    later = datetime.now(timezone.utc) + timedelta(seconds=20)
+    respond_with(llm, monkeypatch, FakeResponse(503, headers={'Retry-After': format_datetime(later, usegmt=True)}), ok())
+    llm._make_api_call(MESSAGES, "large-model")
+    assert 15 <= sleeps[0] <= 20
+
+def test_post_caps_retry_after(llm, monkeypatch, sleeps):
+    respond_with(llm, monkeypatch, FakeResponse(429, headers={'Retry-After': '3600'}), ok())
+    llm._make_api_call(MESSAGES, "large-model")
+    assert sleeps == [llm.backoff_max]
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404, 422])
+def test_post_does_not_retry_client_errors(llm, monkeypatch, sleeps, status):
+    posts = respond_with(llm, monkeypatch, FakeResponse(status), ok())
+    with pytest.raises(requests.HTTPError):
+        llm._make_api_call(MESSAGES, "large-model")
+    assert len(posts) == 1
+    assert sleeps == []
+
+def test_post_gives_up_after_max_retries(llm, monkeypatch, sleeps):
+    responses = [FakeResponse(503) for _ in range(llm.max_retries + 1)]
+    posts = respond_with(llm, monkeypatch, *responses)
+    with pytest.raises(requests.HTTPError):
+        llm._make_api_call(MESSAGES, "large-model")
+    assert len(posts) == llm.max_retries + 1
+    assert len(sleeps) == llm.max_retries
+    # Every response was closed and its endpoint released
+    assert all(response.closed for response in responses)
+    assert all(endpoint.outstanding == 0 for endpoint in llm.endpoints.endpoints)
+
+def test_post_raises_the_last_connection_error(llm, monkeypatch, sleeps):
+    respond_with(llm, monkeypatch, *[requests.ConnectionError("refused")] * (llm.max_retries + 1))
+    with pytest.raises(requests.ConnectionError, match="refused"):
+        llm._make_api_call(MESSAGES, "large-model")
+    assert len(sleeps) == llm.max_retries
+
+@pytest.fixture
+def cached_llm(llm, tmp_path):
+    llm.cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    return llm
+
+def test_responses_are_not_cached_by_default(cached_llm):
+    calls = answer_with(cached_llm, {"large-model": "Large."})
+    cached_llm.get_response(MESSAGES)
+    cached_llm.get_response(MESSAGES)
+    assert calls == ["large-model", "large-model"]
+
+def test_cached_responses_are_opt_in(cached_llm):
+    calls = answer_with(cached_llm, {"large-model": "Large."})
+    assert cached_llm.get_response(MESSAGES, use_cache=True) == "Large."
+    assert cached_llm.get_response(MESSAGES, use_cache=True) == "Large."
+    assert calls == ["large-model"]
+
+def test_request_params_are_part_of_the_cache_key(cached_llm):
+    calls = answer_with(cached_llm, {"large-model": "Large."})
+    cached_llm.get_response(MESSAGES, use_cache=True, params={"temperature": 0})
+    cached_llm.get_response(MESSAGES, use_cache=True, params={"temperature": 1})
+    cached_llm.get_response(MESSAGES, use_cache=True, params={"temperature": 0, "max_tokens": 10})
+    cached_llm.get_response(MESSAGES, use_cache=True, params={"temperature": 0})
+    assert len(calls) == 3
+
+def test_request_params_are_sent(llm, monkeypatch):
+    posts = respond_with(llm, monkeypatch, ok())
+    llm._make_api_call(MESSAGES, "large-model", {"temperature": 0, "max_tokens": 10})
+    assert posts[0]["temperature"] == 0 and posts[0]["max_tokens"] == 10
@@ -0,0 +1,55 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.prefetcher import Prefetcher
+
+from .fakes import FakeSource, items
+
+def run_for(prefetcher, seconds):
+    async def main():
+        task = asyncio.create_task(prefetcher.run())
+        await asyncio.sleep(seconds)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    asyncio.run(main())
+
+def test_interval_shrinks_when_data_changes_and_grows_when_not():
+    changing, quiet = FakeSource(items(1)), FakeSource(items(1))
+    original = changing._fetch_data
+
+    def fetch():
+        changing.records = items(len(changing.records) + 1)
+        return original()
+
+    changing._fetch_data = fetch
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        prefetcher = Prefetcher([changing, quiet], executor, min_interval=0.05, max_interval=0.4)
+        for state in prefetcher.states.values():
+            state['interval'] = 0.1
+        run_for(prefetcher, 0.5)
+
+    assert prefetcher.states[changing]['interval'] < prefetcher.states[quiet]['interval']
+    assert prefetcher.states[quiet]['interval'] <= 0.4
+
+def test_refresh_tasks_have_stopped_once_run_returns():
+    source = FakeSource(items(1))
+    original = source._fetch_data
+
+    def slow_fetch():
+        time.sleep(0.2)
+        return original()
+
+    source._fetch_data = slow_fetch
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        prefetcher = Prefetcher([source], executor, min_interval=0.01)
+        prefetcher.states[source]['interval'] = 0.01
+
+        async def main():
+            task = asyncio.create_task(prefetcher.run())
+            await asyncio.sleep(0.05)  # a refresh is now in flight
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return prefetcher.states[source]['running']
+
+        assert asyncio.run(main()) is False
@@ -0,0 +1,57 @@
+from src.data_sources import RecordStore
+
+from .fakes import Item
+
+RECORDS = [
+    Item('a', "a", due="2024-06-03"),
+    Item('b', "b", due="2024-06-01"),
+    Item('c', "c"),
+    Item('d', "d", due="2024-06-03"),
+    Item('e', "e", due="2024-06-10"),
+]
+
+def make_store():
+    return RecordStore(
+        RECORDS,
+        sorted_by={'due': lambda item: item.due or None},
+        grouped_by={'due': lambda item: item.due or None}
+    )
+
+def ids(records):
+    return [record.id for record in records]
+
+def test_range_is_inclusive_and_in_key_order():
+    store = make_store()
+    assert ids(store.range('due', "2024-06-01", "2024-06-03")) == ['b', 'a', 'd']
+    assert ids(store.range('due', "2024-06-02", "2024-06-09")) == ['a', 'd']
+
+def test_range_bounds_are_optional():
+    store = make_store()
+    assert ids(store.range('due')) == ['b', 'a', 'd', 'e']
+    assert ids(store.range('due', low="2024-06-03")) == ['a', 'd', 'e']
+    assert ids(store.range('due', high="2024-06-02")) == ['b']
+
+def test_empty_range():
+    assert make_store().range('due', "2024-07-01", "2024-07-31") == []
+
+def test_first_after_is_strictly_greater():
+    store = make_store()
+    assert store.first_after('due', "2024-06-01").id == 'a'
+    assert store.first_after('due', "2024-06-03").id == 'e'
+    assert store.first_after('due', "2024-06-10") is None
+
+def test_group():
+    store = make_store()
+    assert ids(store.group('due', "2024-06-03")) == ['a', 'd']
+    assert store.group('due', "2024-01-01") == []
+
+def test_none_keys_are_left_out_of_indexes():
+    store = make_store()
+    assert len(store) == 5
+    assert 'c' not in ids(store.range('due'))
+    assert store.group('due', None) == []
+
+def test_empty_store():
+    store = RecordStore([], sorted_by={'due': lambda item: item.due})
+    assert store.range('due') == []
+    assert store.first_after('due', "2024-01-01") is None
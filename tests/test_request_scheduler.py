@@ -0,0 +1,87 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from src.data_sources.request_scheduler import RequestScheduler
+
+def throttled():
+    return HttpError(httplib2.Response({'status': 429}), b'{"error": {"message": "Too many requests"}}')
+
+class FakeBatch:
+    """Answers every item, throttling those the test says to."""
+
+    def __init__(self, callback, throttle):
+        self.callback = callback
+        self.throttle = throttle
+        self.ids = []
+
+    def add(self, request, request_id):
+        self.ids.append(request_id)
+
+    def execute(self):
+        for request_id in self.ids:
+            if self.throttle(request_id):
+                self.callback(request_id, None, throttled())
+            else:
+                self.callback(request_id, {'id': request_id}, None)
+
+def make_scheduler(**kwargs):
+    return RequestScheduler(backoff_base=0.0, backoff_max=0.0, **kwargs)
+
+def test_throttled_batch_items_are_retried():
+    scheduler = make_scheduler()
+    batches = []
+    attempts = {}
+
+    def throttle(request_id):
+        attempts[request_id] = attempts.get(request_id, 0) + 1
+        return request_id == 'b' and attempts[request_id] < 3
+
+    def new_batch(callback):
+        batches.append(FakeBatch(callback, throttle))
+        return batches[-1]
+
+    results = {}
+    scheduler.execute_batch(
+        'gmail', ['a', 'b', 'c'], lambda request_id: request_id, new_batch,
+        lambda request_id, response, exception: results.update({request_id: (response, exception)}),
+        lambda batch: batch.execute()
+    )
+    assert [batch.ids for batch in batches] == [['a', 'b', 'c'], ['b'], ['b']]
+    assert all(exception is None for _, exception in results.values())
+    assert scheduler.throttled == 2
+
+def test_items_still_throttled_after_the_retries_are_reported():
+    scheduler = make_scheduler(max_retries=1)
+    results = {}
+    scheduler.execute_batch(
+        None, ['a'], lambda request_id: request_id,
+        lambda callback: FakeBatch(callback, lambda request_id: True),
+        lambda request_id, response, exception: results.update({request_id: exception}),
+        lambda batch: batch.execute()
+    )
+    assert isinstance(results['a'], HttpError)
+
+def test_throttled_requests_are_retried_then_raised():
+    scheduler = make_scheduler(max_retries=2)
+    calls = []
+
+    def execute(request):
+        calls.append(request)
+        raise throttled()
+
+    with pytest.raises(HttpError):
+        scheduler.execute(None, object(), execute)
+    assert len(calls) == 3
+
+def test_other_errors_are_not_retried():
+    scheduler = make_scheduler()
+    calls = []
+
+    def execute(request):
+        calls.append(request)
+        raise HttpError(httplib2.Response({'status': 404}), b'')
+
+    with pytest.raises(HttpError):
+        scheduler.execute(None, object(), execute)
+    assert len(calls) == 1
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import src.response_cache as response_cache
+from src.response_cache import ResponseCache
+
+def key(content):
+    return ResponseCache.make_key("model", [{"role": "user", "content": content}])
+
+def test_key_ignores_whitespace_only_differences():
+    assert key("What is  on\nmy calendar?") == key("What is on my calendar?")
+
+def test_key_includes_request_params():
+    messages = [{"role": "user", "content": "hello"}]
+    cold = ResponseCache.make_key("model", messages, {"temperature": 0})
+    assert cold == ResponseCache.make_key("model", messages, {"temperature": 0})
+    assert cold != ResponseCache.make_key("model", messages, {"temperature": 1})
+    assert cold != ResponseCache.make_key("model", messages, {"temperature": 0, "max_tokens": 10})
+    assert cold != ResponseCache.make_key("model", messages)
+
+def test_key_keeps_the_time_of_day():
+    morning = "Current date/time: Monday, June 03, 2024 at 09:15 AM\nWhat time is it?"
+    later = "Current date/time: Monday, June 03, 2024 at 09:19 AM\nWhat time is it?"
+    assert key(morning) != key(later)
+
+def test_entries_expire_after_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), ttl=0.0)
+    cache.put("key", "response")
+    assert cache.get("key") is None
+    cache.close()
+
+def test_put_then_get(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("key", "response")
+    assert cache.get("key") == "response"
+    cache.close()
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    now = iter(range(1000, 2000))
+    monkeypatch.setattr(response_cache, "time", SimpleNamespace(time=lambda: next(now)))
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"  # b is now the least recently used
+    cache.put("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+    cache.close()
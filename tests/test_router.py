@@ -0,0 +1,52 @@
+import pytest
+
+from src.router import QueryRouter
+
+from .fakes import FakeSource
+
+def make_router(**kwargs):
+    sources = []
+    for name in ("Calendar", "Gmail", "Tasks"):
+        source = FakeSource([])
+        source.name = name
+        sources.append(source)
+    return QueryRouter(sources, log_path="", **kwargs)
+
+def names(router, query):
+    return [source.name for source in router.route(query)]
+
+@pytest.mark.parametrize("query, expected", [
+    ("Any new emails from Sam?", ["Gmail"]),
+    ("What's in my inbox", ["Gmail"]),
+    ("Do I have any meetings?", ["Calendar"]),
+    ("What's overdue?", ["Tasks"]),
+    ("Did Alex reply about the meeting?", ["Calendar", "Gmail"]),
+    ("Anything on Friday?", ["Calendar", "Tasks"]),
+    ("What about 3pm", ["Calendar", "Tasks"]),
+    ("Give me a briefing", ["Calendar", "Gmail", "Tasks"]),
+    ("What's up?", ["Calendar", "Gmail", "Tasks"]),
+    ("Thanks!", []),
+    ("hi there", ["Calendar", "Gmail", "Tasks"]),
+])
+def test_routes(query, expected):
+    assert names(make_router(), query) == expected
+
+def test_small_talk_needs_whole_message():
+    assert names(make_router(), "thanks, any new mail?") == ["Gmail"]
+
+def test_unmatched_falls_back_to_every_source():
+    assert names(make_router(), "what should I cook") == ["Calendar", "Gmail", "Tasks"]
+
+def test_classifier_decides_unmatched_queries():
+    router = make_router(classifier=lambda query: ["Tasks"])
+    assert names(router, "what should I cook") == ["Tasks"]
+    assert names(make_router(classifier=lambda query: None), "what should I cook") == ["Calendar", "Gmail", "Tasks"]
+
+@pytest.mark.parametrize("reply", ["yes", "Yes please!", "ok", "nope", "sure, go ahead"])
+def test_replies_reuse_the_previous_sources(reply):
+    router = make_router()
+    router.route("Anything overdue?")
+    assert names(router, reply) == ["Tasks"]
+
+def test_reply_without_a_previous_turn_uses_every_source():
+    assert names(make_router(), "yes") == ["Calendar", "Gmail", "Tasks"]
@@ -0,0 +1,114 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.scheduler import CronTrigger, IntervalTrigger, Job, Scheduler
+
+@pytest.mark.parametrize("expression, after, expected", [
+    ("30 8 * * *", datetime(2024, 6, 3, 8, 29), datetime(2024, 6, 3, 8, 30)),
+    ("30 8 * * *", datetime(2024, 6, 3, 8, 30), datetime(2024, 6, 4, 8, 30)),
+    ("*/15 9-17 * * 1-5", datetime(2024, 6, 7, 17, 50), datetime(2024, 6, 10, 9, 0)),  # Friday -> Monday
+    ("0 0 29 2 *", datetime(2023, 3, 1), datetime(2024, 2, 29)),
+    ("0 9 * 12 *", datetime(2024, 12, 31, 10), datetime(2025, 12, 1, 9)),
+    ("5,10 * * * *", datetime(2024, 6, 3, 8, 7, 30), datetime(2024, 6, 3, 8, 10)),
+    ("10/20 * * * *", datetime(2024, 6, 3, 8, 31), datetime(2024, 6, 3, 8, 50)),
+])
+def test_cron_next_fire(expression, after, expected):
+    assert CronTrigger(expression).next_fire(after) == expected
+
+def test_cron_day_or_weekday():
+    # Restricting both the day and the weekday fires on either
+    trigger = CronTrigger("0 12 1 * 1")
+    assert trigger.next_fire(datetime(2024, 6, 1, 13)) == datetime(2024, 6, 3, 12)  # a Monday
+    assert trigger.next_fire(datetime(2024, 6, 24, 13)) == datetime(2024, 7, 1, 12)
+
+def test_cron_sunday_is_zero():
+    assert CronTrigger("0 10 * * 0").next_fire(datetime(2024, 6, 3)) == datetime(2024, 6, 9, 10)
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "* 24 * * *", "5-1 * * * *", "* * 0 * *", "x * * * *"])
+def test_cron_rejects_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronTrigger(expression)
+
+def test_cron_that_never_fires():
+    with pytest.raises(ValueError):
+        CronTrigger("0 0 31 2 *").next_fire(datetime(2024, 1, 1))
+
+def test_interval_trigger():
+    assert IntervalTrigger(90).next_fire(datetime(2024, 6, 3, 8)) == datetime(2024, 6, 3, 8, 1, 30)
+    with pytest.raises(ValueError):
+        IntervalTrigger(0)
+
+def test_missed_fires_coalesce_into_one_run():
+    scheduler = Scheduler()
+    job = Job("job", IntervalTrigger(60), lambda: None, misfire_grace_time=600)
+    start = datetime(2024, 6, 3, 8)
+    scheduler.add_job(job, now=start)
+    assert scheduler._due_runs(job, start + timedelta(minutes=5, seconds=30)) == 1
+    assert job.next_run == start + timedelta(minutes=6)
+
+def test_missed_fires_without_coalescing():
+    scheduler = Scheduler()
+    job = Job("job", IntervalTrigger(60), lambda: None, misfire_grace_time=150, coalesce=False)
+    start = datetime(2024, 6, 3, 8)
+    scheduler.add_job(job, now=start)
+    # Fires at 8:01 .. 8:05; only those within 150s of 8:05:30 still run
+    assert scheduler._due_runs(job, start + timedelta(minutes=5, seconds=30)) == 3
+
+def test_coroutine_jobs_run_on_the_loop():
+    scheduler = Scheduler()
+    runs = []
+
+    async def job():
+        runs.append(datetime.now())
+
+    async def main():
+        scheduler.add_job(Job("job", IntervalTrigger(0.05), job))
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.3)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    assert len(runs) >= 2
+    assert scheduler.executor is None
+    scheduler.shutdown()
+
+def test_plain_jobs_run_on_a_worker_thread():
+    scheduler = Scheduler()
+    runs = []
+
+    async def main():
+        scheduler.add_job(Job("job", IntervalTrigger(0.05), lambda: runs.append(1)))
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    assert runs
+    assert scheduler.executor is not None
+    scheduler.shutdown()
+    assert scheduler.executor is None
+
+def test_running_jobs_have_stopped_once_run_returns():
+    scheduler = Scheduler()
+    state = {}
+
+    async def job():
+        state['started'] = True
+        try:
+            await asyncio.sleep(10)
+        finally:
+            state['stopped'] = True
+
+    async def main():
+        scheduler.add_job(Job("job", IntervalTrigger(0.01), job))
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return dict(state)
+
+    assert asyncio.run(main()) == {'started': True, 'stopped': True}
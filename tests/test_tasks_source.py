@@ -0,0 +1,148 @@
+import pytest
+
+from src.data_sources import GoogleTasksSource
+
+from .fakes import FakeRequest, http_error, with_service
+
+class FakeTasks:
+    """
+    The parts of the Tasks API GoogleTasksSource uses. tasks().list answers
+    with the responses queued in pages (an exception is raised instead of
+    returned) and records the parameters and headers of every call.
+    """
+
+    def __init__(self):
+        self.tasklists_etag = 'lists-v1'
+        self.pages = []
+        self.calls = []
+
+    def tasklists(self):
+        return FakeTasklists(self)
+
+    def tasks(self):
+        return FakeTaskList(self)
+
+class FakeTasklists:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, maxResults, pageToken=None):
+        request = FakeRequest(lambda: respond())
+
+        def respond():
+            if request.headers.get('If-None-Match') == self.service.tasklists_etag:
+                raise http_error(304)
+            return {'items': [{'id': 'list', 'title': 'Errands'}], 'etag': self.service.tasklists_etag}
+        return request
+
+class FakeTaskList:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, pageToken=None, **params):
+        request = FakeRequest(lambda: respond())
+
+        def respond():
+            self.service.calls.append((pageToken, params, dict(request.headers)))
+            response = self.service.pages.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return request
+
+def task(task_id, title=None, **fields):
+    return {'id': task_id, 'title': title or f"task {task_id}", 'status': 'needsAction', **fields}
+
+def page(*tasks, next_page=None, etag=None):
+    result = {'items': list(tasks)}
+    if next_page:
+        result['nextPageToken'] = next_page
+    if etag:
+        result['etag'] = etag
+    return result
+
+@pytest.fixture
+def service():
+    return FakeTasks()
+
+@pytest.fixture
+def source(service, monkeypatch):
+    return with_service(GoogleTasksSource(), service, monkeypatch)
+
+def titles(tasks):
+    return sorted((task.title, task.status) for task in tasks)
+
+def test_incremental_fetch_merges_changes_into_the_stored_tasks(source, service):
+    service.pages = [page(task('a'), task('b'), task('c'), task('d'))]
+    source._fetch_data()
+    watermark = source._lists['list']['updated_min']
+
+    service.calls.clear()
+    service.pages = [page(
+        task('a', status='completed'),
+        task('b', 'renamed'),
+        task('c', deleted=True),
+        task('d', status='completed', hidden=True),  # completed and cleared
+        task('e'),
+    )]
+
+    assert titles(source._fetch_data()) == [('renamed', 'needsAction'), ('task a', 'completed'), ('task e', 'needsAction')]
+    _, params, _ = service.calls[0]
+    assert params['updatedMin'] == watermark
+    assert params['showDeleted'] and params['showHidden']
+
+def test_first_fetch_is_a_full_listing(source, service):
+    service.pages = [page(task('a'))]
+
+    source._fetch_data()
+    _, params, headers = service.calls[0]
+    assert 'updatedMin' not in params
+    assert not params['showHidden']
+    assert 'If-None-Match' not in headers
+
+def test_unchanged_list_is_answered_with_not_modified(source, service):
+    service.pages = [page(task('a'), task('b'))]
+    first = source._fetch_data()
+    service.pages = [page(etag='tasks-v1')]  # no changes since the watermark
+    assert source._fetch_data() == first
+    watermark = source._lists['list']['updated_min']
+
+    service.calls.clear()
+    service.pages = [http_error(304)]
+    assert source._fetch_data() == first
+    _, params, headers = service.calls[0]
+    assert headers['If-None-Match'] == 'tasks-v1'
+    assert params['updatedMin'] == watermark
+    # The watermark stays put so the ETag keeps describing the same query
+    assert source._lists['list']['updated_min'] == watermark
+
+def test_a_change_clears_the_etag(source, service):
+    service.pages = [page(task('a'))]
+    source._fetch_data()
+    service.pages = [page(etag='tasks-v1')]
+    source._fetch_data()
+
+    service.pages = [page(task('a', status='completed'), etag='tasks-v2')]
+    assert titles(source._fetch_data()) == [('task a', 'completed')]
+    assert source._lists['list']['etag'] is None
+
+    service.calls.clear()
+    service.pages = [page()]
+    source._fetch_data()
+    _, _, headers = service.calls[0]
+    assert 'If-None-Match' not in headers
+
+def test_tasks_are_read_page_by_page(source, service):
+    service.pages = [page(task('a'), next_page='p2'), page(task('b'))]
+    assert titles(source._fetch_data()) == [('task a', 'needsAction'), ('task b', 'needsAction')]
+
+    service.calls.clear()
+    service.pages = [page(task('a', deleted=True), next_page='p2', etag='page-1'), page(task('c'))]
+    assert titles(source._fetch_data()) == [('task b', 'needsAction'), ('task c', 'needsAction')]
+    assert [page_token for page_token, _, _ in service.calls] == [None, 'p2']
+    assert all('updatedMin' in params for _, params, _ in service.calls)
+
+    # An ETag would only describe the first page, so paged results keep none
+    service.pages = [page(next_page='p2', etag='page-1'), page(etag='page-2')]
+    source._fetch_data()
+    assert source._lists['list']['etag'] is None